@@ -37,8 +37,50 @@ theta_emk_0 = 293  # K (20°C)
 t_max = 2.0        # секунд (сокращено чтобы фокусироваться на переходной части)
 dt = 0.0005        # шаг интегрирования
 
+# Непрерывное продолжение решения (simulation.DenseSolution):
+# контрольная точка сохраняется раз в столько шагов
+dense_checkpoint_steps = 64
+# Предельное число моментов output_times в одном запросе /api/run
+max_output_times = 100000
+
 # Интервал печати промежуточных результатов (в секундах)
 print_interval = 1.0
 # Valve time constant (first-order smoothing of commanded mass flow)
 # Lower values -> valve follows commanded flow faster. Increase to smooth spikes.
 valve_tau = 0.01  # seconds
+
+# Квазистационарная (редуцированная) модель клапана: G = G_cmd, 4 состояния.
+# model_mode: 'full' — всегда полная модель; 'reduced' — всегда редуцированная;
+# 'auto' — автоматическое переключение по разделению масштабов времени.
+model_mode = 'full'
+qss_ratio = 0.02          # переход к G = G_cmd при valve_tau < qss_ratio * tau_p
+qss_step_fraction = 0.005  # шаг редуцированной модели — доля масштаба tau_p
+qss_dt_max = 0.01         # верхний предел шага редуцированной модели, с
+
+# Монте-Карло: распространение неопределённостей параметров (montecarlo.py)
+# Распределения задаются относительно номинального значения параметра:
+#   ('normal', s)  -> theta = theta_0 * (1 + s * N(0, 1))
+#   ('uniform', h) -> theta = theta_0 * (1 + U(-h, h))
+mc_distributions = {
+    'mu_f': ('normal', 0.05),        # допуск коэффициента расхода шайбы, 1σ = 5 %
+    'rho_b_0': ('normal', 0.02),     # начальная плотность заправки, 1σ = 2 %
+    'theta_b_0': ('uniform', 0.01),  # начальная температура в баллоне, ±1 % (≈ ±3 K)
+}
+mc_samples = 200          # число реализаций
+mc_workers = None         # число процессов (None -> os.cpu_count())
+mc_batch_size = 8         # реализаций в одной задаче для процесса
+mc_grid_points = 201      # узлов общей временной сетки на [0, t_max]
+mc_quantiles = (0.05, 0.5, 0.95)
+mc_seed = 12345
+mc_max_samples_web = 1000  # ограничение числа реализаций для /api/montecarlo
+
+# Веб-приложение: оценка стоимости расчёта и допуск запросов (cost.py, webapp/app.py)
+# Начальная производительность интегратора, шагов RK4 в секунду (уточняется по факту запусков)
+steps_per_sec = {'ideal': 20000.0, 'vdw': 5000.0}
+web_run_budget_s = 30.0     # максимальная оценка времени одного расчёта, с (больше — отказ)
+web_queue_budget_s = 60.0   # суммарная оценка выполняемых и ожидающих расчётов, с (больше — 503)
+web_run_timeout_s = 60.0    # предельное время ответа на запрос, с (по истечении — частичный результат)
+cancel_check_steps = 256    # как часто run_simulation проверяет отмену и дедлайн, шагов
+# Для model_mode 'auto'/'reduced' число шагов зависит от траектории: оно оценивается
+# пробным запуском из стольких шагов с экстраполяцией на t_max
+cost_probe_steps = 500
@@ -0,0 +1,122 @@
+"""
+Оценка стоимости расчёта: число шагов и ожидаемое время.
+
+    steps   = ceil(t_max / dt)
+    seconds = steps / steps_per_sec[gas_model]
+
+Для режимов модели с переменным шагом ('auto', 'reduced') число шагов
+берётся из пробного запуска: `probe = (t_reached, steps)` экстраполируется
+на t_max. Шаг редуцированной модели растёт по мере выпуска, поэтому такая
+оценка получается с запасом. `probe_run` выполняется в отдельном процессе
+(config.py там свой), а результаты пробных и полных запусков кэшируются
+в `CostModel` по набору параметров.
+
+Производительность (шагов в секунду) для каждой модели газа начинается со
+значений `cfg.steps_per_sec` и уточняется по измеренным запускам
+(экспоненциальное сглаживание), поэтому оценка подстраивается под машину.
+"""
+
+import json
+import math
+import threading
+from collections import OrderedDict
+
+import config as cfg
+
+
+def estimate_steps(t_max, dt, probe=None):
+    """
+    Число шагов интегратора для расчёта до t_max с шагом dt.
+    probe — (t_reached, steps) пробного запуска, если шаг переменный.
+    """
+    if dt <= 0 or t_max <= 0:
+        raise ValueError("t_max и dt должны быть положительными")
+    if probe is not None:
+        t_reached, steps = probe
+        if t_reached >= t_max - 1e-12:
+            return int(steps)
+        if t_reached > 0:
+            return int(math.ceil(steps * t_max / t_reached))
+    return int(math.ceil(t_max / dt - 1e-9))
+
+
+def probe_run(params, max_steps):
+    """
+    Пробный запуск из `max_steps` шагов с параметрами `params` (переопределения
+    config.py). Предназначен для процесса-работника. Возвращает (t_reached, steps).
+    """
+    from simulation import run_simulation
+
+    snap = {k: getattr(cfg, k, None) for k in params}
+    info = {}
+    try:
+        for k, v in params.items():
+            setattr(cfg, k, v)
+        run_simulation(output_times=[], info=info, max_steps=max_steps)
+    finally:
+        for k, v in snap.items():
+            setattr(cfg, k, v)
+    return info['t_end'], info['steps']
+
+
+class CostModel:
+    """Потокобезопасная модель стоимости с измеряемой производительностью."""
+
+    def __init__(self, steps_per_sec=None, alpha=0.2, max_probes=256):
+        self._lock = threading.Lock()
+        self._rate = dict(cfg.steps_per_sec if steps_per_sec is None else steps_per_sec)
+        self.alpha = alpha
+        # (t_reached, steps) по наборам параметров, последние max_probes
+        self._probes = OrderedDict()
+        self.max_probes = max_probes
+
+    @staticmethod
+    def _probe_key(params):
+        return json.dumps(params, sort_keys=True)
+
+    def cached_probe(self, params):
+        """Сохранённый (t_reached, steps) для набора параметров или None."""
+        key = self._probe_key(params)
+        with self._lock:
+            probe = self._probes.get(key)
+            if probe is not None:
+                self._probes.move_to_end(key)
+            return probe
+
+    def store_probe(self, params, probe):
+        """Запомнить (t_reached, steps) пробного или полного запуска."""
+        key = self._probe_key(params)
+        with self._lock:
+            old = self._probes.get(key)
+            # полный запуск (больший t_reached) точнее пробного
+            if old is None or probe[0] >= old[0]:
+                self._probes[key] = tuple(probe)
+            self._probes.move_to_end(key)
+            while len(self._probes) > self.max_probes:
+                self._probes.popitem(last=False)
+
+    def rate(self, gas_model):
+        with self._lock:
+            return self._rate.get(gas_model, self._rate.get('ideal', 1.0))
+
+    def estimate(self, t_max, dt, gas_model='ideal', probe=None):
+        """Вернуть (steps, seconds) для заданных параметров (probe — см. `estimate_steps`)."""
+        steps = estimate_steps(t_max, dt, probe)
+        return steps, steps / self.rate(gas_model)
+
+    def observe(self, gas_model, steps, seconds):
+        """
+        Учесть фактический запуск: `steps` шагов за `seconds` секунд.
+        Модели газа, для которых нет начальной производительности, не учитываются.
+        """
+        if steps <= 0 or seconds <= 0:
+            return
+        measured = steps / seconds
+        with self._lock:
+            old = self._rate.get(gas_model)
+            if old is not None:
+                self._rate[gas_model] = (1 - self.alpha) * old + self.alpha * measured
+
+    def rates(self):
+        with self._lock:
+            return dict(self._rate)
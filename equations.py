@@ -1,6 +1,9 @@
 import config as cfg
 import math
 
+# Уравнения состояния, поддерживаемые `density` (cfg.gas_model)
+GAS_MODELS = ('ideal', 'vdw')
+
 
 def density(p, T):
     """
@@ -87,53 +90,62 @@ def mass_flow(p_b, T_b, p_emk):
         # критический режим (захлёст)
         return mu_f * m * p_b / math.sqrt(T_b)
 
-def rhs(t, y):
+def mass_flow_partials(p_b, T_b, p_emk):
     """
-    Правая часть системы ОДУ для баллона и емкости с динамической моделью запорного
-    устройства (вентили/ограничителя расхода).
-    y = [p_b, T_b, p_emk, T_emk, G]
+    Командный расход G_cmd и его частные производные.
+    Возвращает (G_cmd, dG/dp_b, dG/dT_b, dG/dp_emk).
+    """
+    if p_emk >= p_b or T_b <= 0:
+        return 0.0, 0.0, 0.0, 0.0
 
-    Модель клапана: G_dot = (G_cmd - G) / tau, где G_cmd = mass_flow(...)
+    n = cfg.n
+    G = mass_flow(p_b, T_b, p_emk)
+    if G <= 0:
+        return 0.0, 0.0, 0.0, 0.0
 
-    Массовый баланс использует текущий (фактический) G.
-    """
-    # Ожидаемое состояние: p_b, T_b, p_emk, T_emk, G
-    if len(y) >= 5:
-        p_b, T_b, p_emk, T_emk, G = y
+    # В обоих режимах G ∝ sqrt(p_b / T_b) или p_b / sqrt(T_b) -> ∂G/∂T_b = -G / (2 T_b)
+    dG_dTb = -G / (2 * T_b)
+
+    beta = (2 / (n + 1)) ** (n / (n - 1))
+    if p_emk > beta * p_b:
+        # докритический режим: G = mu_f * phi(v) * sqrt(C * p_b / T_b), v = p_emk / p_b
+        v = p_emk / p_b
+        a = 2 / (n - 1)
+        b = (n + 1) / (n - 1)
+        phi_val = math.sqrt(max(v ** a - v ** b, 0.0))
+        dphi_dv = (a * v ** (a - 1) - b * v ** (b - 1)) / (2 * phi_val)
+        scale = G / phi_val  # = mu_f * sqrt(C * p_b / T_b)
+        dG_dpemk = scale * dphi_dv / p_b
+        dG_dpb = G / (2 * p_b) - scale * dphi_dv * v / p_b
     else:
-        # на случай вызова со старым вектором: дополняем нулевым G
-        p_b, T_b, p_emk, T_emk = y
-        G = 0.0
+        # критический режим: G = mu_f * m * p_b / sqrt(T_b)
+        dG_dpemk = 0.0
+        dG_dpb = G / p_b
 
-    # Параметры
-    n = cfg.n
-    R = cfg.R
-    tau = getattr(cfg, 'valve_tau', 0.01)
-    gas_model = getattr(cfg, 'gas_model', 'ideal')
-
-    def density_and_derivs(p, T):
-        """
-        Вернуть rho, dρ/dp, dρ/dT. Для сложных EOS используем центральные разности.
-        """
-        rho = density(p, T)
-        # finite differences
-        dp = max(1e-6 * p, 1e-6)
-        dT = max(1e-6 * T, 1e-6)
-        rho_p = (density(p + dp, T) - density(p - dp, T)) / (2 * dp)
-        rho_T = (density(p, T + dT) - density(p, T - dT)) / (2 * dT)
-        return rho, rho_p, rho_T
+    return G, dG_dpb, dG_dTb, dG_dpemk
 
-    # Защита от нефизичных значений: если давления или температуры невалидны,
-    # заставляем расход убывать к нулю (клапан закрывается) и возвращаем нули для dp/dt.
-    if p_b <= 0 or T_b <= 0 or p_emk <= 0 or T_emk <= 0:
-        dG_dt = -G / tau
-        return [0.0, 0.0, 0.0, 0.0, dG_dt]
 
-    # Командный расход, который даёт текущее соотношение давлений/температуры
-    G_cmd = mass_flow(p_b, T_b, p_emk)
+def _density_and_derivs(p, T):
+    """
+    Вернуть rho, dρ/dp, dρ/dT. Для сложных EOS используем центральные разности.
+    """
+    rho = density(p, T)
+    # finite differences
+    dp = max(1e-6 * p, 1e-6)
+    dT = max(1e-6 * T, 1e-6)
+    rho_p = (density(p + dp, T) - density(p - dp, T)) / (2 * dp)
+    rho_T = (density(p, T + dT) - density(p, T - dT)) / (2 * dT)
+    return rho, rho_p, rho_T
 
-    # Динамика клапана (первого порядка)
-    dG_dt = (G_cmd - G) / tau
+
+def thermo_rates(p_b, T_b, p_emk, T_emk, G):
+    """
+    Производные термодинамических состояний [dp_b, dT_b, dp_emk, dT_emk]
+    при заданном фактическом расходе G (общая часть полной и редуцированной моделей).
+    """
+    # Параметры
+    n = cfg.n
+    R = cfg.R
 
     # ===== БАЛЛОН =====
     # Общий подход для любой EOS:
@@ -146,7 +158,7 @@ def rhs(t, y):
     cp = cv + R
 
     # Cylinder
-    rho_b, rho_bp, rho_bT = density_and_derivs(p_b, T_b)
+    rho_b, rho_bp, rho_bT = _density_and_derivs(p_b, T_b)
     m_b = rho_b * cfg.V_b
     # avoid zero mass
     if m_b <= 0:
@@ -163,7 +175,7 @@ def rhs(t, y):
     dpb_dt = (-G / cfg.V_b - rho_bT * dTb_dt) / denom
 
     # ===== ЁМКОСТЬ =====
-    rho_emk, rho_ep, rho_eT = density_and_derivs(p_emk, T_emk)
+    rho_emk, rho_ep, rho_eT = _density_and_derivs(p_emk, T_emk)
     m_emk = rho_emk * cfg.V_emk
     if m_emk <= 0:
         dTemk_dt = 0.0
@@ -177,4 +189,84 @@ def rhs(t, y):
     denom_e = rho_ep if rho_ep != 0 else 1e-12
     dpemk_dt = (G / cfg.V_emk - rho_eT * dTemk_dt) / denom_e
 
-    return [dpb_dt, dTb_dt, dpemk_dt, dTemk_dt, dG_dt]
+    return [dpb_dt, dTb_dt, dpemk_dt, dTemk_dt]
+
+
+def rhs(t, y):
+    """
+    Правая часть системы ОДУ для баллона и емкости с динамической моделью запорного
+    устройства (вентили/ограничителя расхода).
+    y = [p_b, T_b, p_emk, T_emk, G]
+
+    Модель клапана: G_dot = (G_cmd - G) / tau, где G_cmd = mass_flow(...)
+
+    Массовый баланс использует текущий (фактический) G.
+    """
+    # Ожидаемое состояние: p_b, T_b, p_emk, T_emk, G
+    if len(y) >= 5:
+        p_b, T_b, p_emk, T_emk, G = y
+    else:
+        # на случай вызова со старым вектором: дополняем нулевым G
+        p_b, T_b, p_emk, T_emk = y
+        G = 0.0
+
+    tau = getattr(cfg, 'valve_tau', 0.01)
+
+    # Защита от нефизичных значений: если давления или температуры невалидны,
+    # заставляем расход убывать к нулю (клапан закрывается) и возвращаем нули для dp/dt.
+    if p_b <= 0 or T_b <= 0 or p_emk <= 0 or T_emk <= 0:
+        dG_dt = -G / tau
+        return [0.0, 0.0, 0.0, 0.0, dG_dt]
+
+    # Командный расход, который даёт текущее соотношение давлений/температуры
+    G_cmd = mass_flow(p_b, T_b, p_emk)
+
+    # Динамика клапана (первого порядка)
+    dG_dt = (G_cmd - G) / tau
+
+    return thermo_rates(p_b, T_b, p_emk, T_emk, G) + [dG_dt]
+
+
+def rhs_reduced(t, y):
+    """
+    Квазистационарная (редуцированная) модель: клапан считается безынерционным,
+    G = G_cmd = mass_flow(p_b, T_b, p_emk), интегрируются только 4 состояния.
+    y = [p_b, T_b, p_emk, T_emk] (5-й элемент, если есть, игнорируется).
+
+    Справедлива, когда valve_tau много меньше масштаба выравнивания давлений
+    (см. `pressure_timescale`).
+    """
+    p_b, T_b, p_emk, T_emk = y[:4]
+    if p_b <= 0 or T_b <= 0 or p_emk <= 0 or T_emk <= 0:
+        return [0.0, 0.0, 0.0, 0.0]
+    return thermo_rates(p_b, T_b, p_emk, T_emk, mass_flow(p_b, T_b, p_emk))
+
+
+def pressure_timescale(y):
+    """
+    Масштаб времени процесса выравнивания давлений при G = G_cmd:
+    наименьшее из Δp / |dΔp/dt| (Δp = p_b - p_emk), y_i / |dy_i/dt| для
+    p_b, T_b, p_emk, T_emk и, в критическом режиме, времени до смены режима
+    (p_emk → beta * p_b). В начале выпуска определяющим обычно оказывается
+    быстрый рост p_emk, ближе к смене режима и выравниванию — расстояние до
+    границы: там G_cmd меняется скачком или как sqrt(Δp), и шаг по этому
+    масштабу стремится к нулю.
+    Возвращает inf, если состояние не меняется.
+    """
+    p_b, T_b, p_emk, T_emk = y[:4]
+    d = rhs_reduced(0.0, y)
+    scale = math.inf
+    rate = abs(d[0] - d[2])
+    if rate > 0:
+        scale = abs(p_b - p_emk) / rate
+    for value, rate in zip((p_b, T_b, p_emk, T_emk), d):
+        if rate != 0:
+            scale = min(scale, abs(value / rate))
+    # приближение к границе критического режима
+    n = cfg.n
+    beta = (2 / (n + 1)) ** (n / (n - 1))
+    gap = beta * p_b - p_emk
+    closing = d[2] - beta * d[0]
+    if gap > 0 and closing > 0:
+        scale = min(scale, gap / closing)
+    return scale
@@ -0,0 +1,157 @@
+"""
+Минимальные метрики в текстовом формате Prometheus (без внешних зависимостей).
+
+Счётчики, шкалы и гистограммы с метками; обновление — одна блокировка и
+несколько арифметических операций, поэтому хуки можно держать включёнными
+в production. `Registry.render()` возвращает текст для `GET /metrics`.
+"""
+
+import bisect
+import threading
+
+# Границы гистограмм по умолчанию
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+STEPS_BUCKETS = (100, 1000, 5000, 10000, 50000, 100000, 500000, 1000000, 5000000)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=None):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _fmt(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        return tuple(labels.get(n, '') for n in self.labelnames)
+
+    def header(self):
+        return [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [f'{self.name}{_labels(self.labelnames, k)} {_fmt(v)}' for k, v in items]
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = float(value)
+
+    def inc(self, amount=1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount=1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [f'{self.name}{_labels(self.labelnames, k)} {_fmt(v)}' for k, v in items]
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [счётчики по корзинам (+Inf последней), сумма, количество]
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][i] += 1
+            state[1] += value
+            state[2] += 1
+
+    def samples(self):
+        with self._lock:
+            items = [(k, (list(s[0]), s[1], s[2])) for k, s in self._values.items()]
+        out = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, c in zip(self.buckets + (float('inf'),), counts):
+                cumulative += c
+                le = 'le="' + _fmt(float(bound)) + '"'
+                out.append(f'{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}')
+            out.append(f'{self.name}_sum{_labels(self.labelnames, key)} {_fmt(total)}')
+            out.append(f'{self.name}_count{_labels(self.labelnames, key)} {count}')
+        return out
+
+
+class Registry:
+    """Набор метрик; `collectors` — функции, обновляющие шкалы перед выдачей."""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self.register(Counter(name, help, labelnames))
+
+    def gauge(self, name, help, labelnames=()):
+        return self.register(Gauge(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def add_collector(self, fn):
+        self._collectors.append(fn)
+
+    def render(self):
+        for fn in self._collectors:
+            fn()
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.header())
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+# Content-Type текстового формата Prometheus
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
@@ -0,0 +1,338 @@
+"""
+Монте-Карло: распространение допусков параметров на p_emk(t), T_b(t), G(t).
+
+Параметры из `cfg.mc_distributions` разыгрываются для каждой реализации,
+реализации считаются пачками в отдельных процессах. Каждая траектория
+вычисляется сразу на общей временной сетке (`run_simulation(output_times=...)`)
+и сворачивается в потоковые статистики:
+
+    - среднее и дисперсия — алгоритм Уэлфорда;
+    - квантили — оценка P² (Jain & Chlamtac, 1985), 5 маркеров на квантиль.
+
+Сами траектории не накапливаются, поэтому память определяется только
+размером сетки и не зависит от числа реализаций.
+
+Использование:
+    from montecarlo import run_monte_carlo
+    bands = run_monte_carlo(samples=500)
+    bands['outputs']['p_emk']['q95']
+"""
+
+import bisect
+import math
+import os
+import random
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+
+import config as cfg
+
+# Величины, для которых строятся доверительные полосы: имя -> индекс в y
+OUTPUTS = {'p_emk': 2, 'T_b': 1, 'G': 4}
+
+
+class RunningStats:
+    """Поэлементные среднее и дисперсия по алгоритму Уэлфорда."""
+
+    def __init__(self, size):
+        self.count = 0
+        self.mean = [0.0] * size
+        self.m2 = [0.0] * size
+
+    def add(self, values):
+        self.count += 1
+        k = self.count
+        mean = self.mean
+        m2 = self.m2
+        for i, x in enumerate(values):
+            delta = x - mean[i]
+            mean[i] += delta / k
+            m2[i] += delta * (x - mean[i])
+
+    def variance(self):
+        if self.count < 2:
+            return [0.0] * len(self.mean)
+        return [v / (self.count - 1) for v in self.m2]
+
+    def std(self):
+        return [math.sqrt(v) for v in self.variance()]
+
+
+class P2Quantile:
+    """Потоковая оценка квантиля p алгоритмом P² (память O(1))."""
+
+    def __init__(self, p):
+        self.p = p
+        self.q = []
+        self.pos = [0, 1, 2, 3, 4]
+        self.desired = [0.0, 2 * p, 4 * p, 2 + 2 * p, 4.0]
+        self.incr = [0.0, p / 2, p, (1 + p) / 2, 1.0]
+
+    def add(self, x):
+        q = self.q
+        if len(q) < 5:
+            q.append(x)
+            if len(q) == 5:
+                q.sort()
+            return
+
+        # найти ячейку k, в которую попало наблюдение, и сдвинуть крайние маркеры
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = bisect.bisect_right(q, x, 1, 4) - 1
+
+        pos = self.pos
+        for i in range(k + 1, 5):
+            pos[i] += 1
+        for i in range(5):
+            self.desired[i] += self.incr[i]
+
+        # подстроить средние маркеры (параболическая, при нарушении порядка — линейная формула)
+        for i in (1, 2, 3):
+            d = self.desired[i] - pos[i]
+            if (d >= 1 and pos[i + 1] - pos[i] > 1) or (d <= -1 and pos[i - 1] - pos[i] < -1):
+                s = 1 if d > 0 else -1
+                qp = q[i] + s / (pos[i + 1] - pos[i - 1]) * (
+                    (pos[i] - pos[i - 1] + s) * (q[i + 1] - q[i]) / (pos[i + 1] - pos[i])
+                    + (pos[i + 1] - pos[i] - s) * (q[i] - q[i - 1]) / (pos[i] - pos[i - 1])
+                )
+                if not (q[i - 1] < qp < q[i + 1]):
+                    qp = q[i] + s * (q[i + s] - q[i]) / (pos[i + s] - pos[i])
+                q[i] = qp
+                pos[i] += s
+
+    def value(self):
+        q = self.q
+        if not q:
+            return float('nan')
+        if len(q) < 5:
+            ordered = sorted(q)
+            return ordered[min(len(ordered) - 1, int(round(self.p * (len(ordered) - 1))))]
+        return q[2]
+
+
+class QuantileSketch:
+    """Набор P²-оценок для нескольких квантилей в каждом узле сетки."""
+
+    def __init__(self, size, quantiles):
+        self.quantiles = tuple(quantiles)
+        self.estimators = [[P2Quantile(p) for _ in range(size)] for p in self.quantiles]
+
+    def add(self, values):
+        for row in self.estimators:
+            for est, x in zip(row, values):
+                est.add(x)
+
+    def values(self):
+        return {quantile_key(p): [est.value() for est in row]
+                for p, row in zip(self.quantiles, self.estimators)}
+
+
+def quantile_key(p):
+    """0.05 -> 'q05', 0.5 -> 'q50', 0.95 -> 'q95'."""
+    return f"q{int(round(p * 100)):02d}"
+
+
+def output_grid(t_max=None, points=None):
+    t_max = cfg.t_max if t_max is None else t_max
+    points = cfg.mc_grid_points if points is None else points
+    if points < 2:
+        return [0.0]
+    return [t_max * i / (points - 1) for i in range(points)]
+
+
+def sample_parameters(distributions, nominal, rng):
+    """Разыграть значения параметров по относительным распределениям."""
+    out = {}
+    for name, spec in distributions.items():
+        kind, width = spec[0], spec[1]
+        theta0 = nominal[name]
+        while True:
+            if kind == 'normal':
+                value = theta0 * (1 + width * rng.gauss(0.0, 1.0))
+            elif kind == 'uniform':
+                value = theta0 * (1 + rng.uniform(-width, width))
+            else:
+                raise ValueError(f"Неизвестное распределение '{kind}' для параметра {name}")
+            # физические параметры положительны: хвост нормального распределения отбрасываем
+            if value > 0 or theta0 <= 0:
+                break
+        out[name] = value
+    return out
+
+
+def _pad(values, size):
+    """
+    Дополнить ряд последним значением до длины сетки (если расчёт закончился раньше).
+    Пустой ряд (расчёт не сделал ни одного шага) заполняется NaN.
+    """
+    if not values:
+        return [float('nan')] * size
+    if len(values) < size:
+        values = values + [values[-1]] * (size - len(values))
+    return values
+
+
+def _run_batch(overrides, distributions, indices, seed, grid, deadline=None, cancel=None):
+    """
+    Рассчитать пачку реализаций (выполняется в процессе-работнике).
+    Возвращает список траекторий {output: значения на сетке}; реализации,
+    прерванные `deadline` или `cancel` (только в том же процессе), не возвращаются.
+    """
+    from simulation import run_simulation
+
+    keys = set(overrides) | set(distributions)
+    snap = {k: getattr(cfg, k, None) for k in keys}
+    trajectories = []
+    try:
+        for k, v in overrides.items():
+            setattr(cfg, k, v)
+        nominal = {name: getattr(cfg, name) for name in distributions}
+        for index in indices:
+            rng = random.Random(seed * 1000003 + index)
+            for k, v in sample_parameters(distributions, nominal, rng).items():
+                setattr(cfg, k, v)
+            # состояние сразу на общей сетке (dense output), без истории шагов
+            info = {}
+            times, results = run_simulation(output_times=grid, cancel=cancel, deadline=deadline, info=info)
+            if info['aborted']:
+                break
+            trajectories.append({
+                name: _pad([r[i] for r in results], len(grid))
+                for name, i in OUTPUTS.items()
+            })
+            for k in distributions:
+                setattr(cfg, k, nominal[k])
+    finally:
+        for k, v in snap.items():
+            setattr(cfg, k, v)
+    return trajectories
+
+
+def _fold_next(pending, fold, stopped, poll=0.1):
+    """
+    Дождаться самой ранней отправленной пачки и свернуть её.
+    Возвращает причину прерывания, если она наступила во время ожидания.
+    """
+    while True:
+        try:
+            result = pending[0].result(timeout=poll)
+        except FutureTimeout:
+            aborted = stopped()
+            if aborted:
+                return aborted
+            continue
+        pending.popleft()
+        fold(result)
+        return None
+
+
+def parallelism(samples, workers=None, batch_size=None):
+    """Число процессов, которые реально будут заняты расчётом `samples` реализаций."""
+    workers = cfg.mc_workers if workers is None else workers
+    workers = max(1, workers or os.cpu_count() or 1)
+    batch_size = max(1, cfg.mc_batch_size if batch_size is None else batch_size)
+    return max(1, min(workers, math.ceil(samples / batch_size)))
+
+
+def run_monte_carlo(samples=None, distributions=None, overrides=None, workers=None,
+                    batch_size=None, quantiles=None, seed=None, grid_points=None,
+                    cancel=None, deadline=None):
+    """
+    Запустить Монте-Карло и вернуть доверительные полосы на общей сетке.
+
+    overrides — переопределения параметров config.py (как в /api/run),
+    остальные аргументы по умолчанию берутся из `cfg.mc_*`.
+    cancel, deadline — как в `run_simulation`: отмена проверяется между
+    пачками, дедлайн — и внутри расчёта каждой реализации. При прерывании
+    полосы строятся по уже посчитанным реализациям.
+
+    Возвращает словарь:
+        {'times': сетка, 'samples': число реализаций, 'quantiles': [...],
+         'outputs': {name: {'mean': [...], 'std': [...], 'q05': [...], ...}},
+         'aborted': None, 'cancelled' или 'deadline'}
+    """
+    samples = cfg.mc_samples if samples is None else int(samples)
+    distributions = dict(cfg.mc_distributions if distributions is None else distributions)
+    overrides = dict(overrides or {})
+    workers = parallelism(samples, workers, batch_size)
+    batch_size = max(1, cfg.mc_batch_size if batch_size is None else batch_size)
+    quantiles = tuple(cfg.mc_quantiles if quantiles is None else quantiles)
+    seed = cfg.mc_seed if seed is None else seed
+
+    grid = output_grid(overrides.get('t_max', cfg.t_max), grid_points)
+    stats = {name: RunningStats(len(grid)) for name in OUTPUTS}
+    sketches = {name: QuantileSketch(len(grid), quantiles) for name in OUTPUTS}
+
+    def fold(trajectories):
+        for traj in trajectories:
+            for name in OUTPUTS:
+                stats[name].add(traj[name])
+                sketches[name].add(traj[name])
+
+    def stopped():
+        if cancel is not None and cancel.is_set():
+            return 'cancelled'
+        if deadline is not None and time.monotonic() >= deadline:
+            return 'deadline'
+        return None
+
+    batches = [list(range(i, min(i + batch_size, samples))) for i in range(0, samples, batch_size)]
+    aborted = None
+
+    if workers == 1:
+        for indices in batches:
+            aborted = stopped()
+            if aborted:
+                break
+            fold(_run_batch(overrides, distributions, indices, seed, grid, deadline, cancel))
+    else:
+        # держим в работе не более 2 пачек на процесс. Пачки сворачиваются строго
+        # в порядке отправки: оценка P² зависит от порядка наблюдений, и при
+        # одинаковом seed полосы должны совпадать. Готовые раньше очереди пачки
+        # ждут в своих Future, их не больше размера окна.
+        pool = ProcessPoolExecutor(max_workers=workers)
+        try:
+            pending = deque()
+            for indices in batches:
+                aborted = stopped()
+                if aborted:
+                    break
+                pending.append(pool.submit(_run_batch, overrides, distributions, indices, seed,
+                                           grid, deadline))
+                if len(pending) >= 2 * workers:
+                    aborted = _fold_next(pending, fold, stopped)
+                    if aborted:
+                        break
+            while pending and not aborted:
+                aborted = _fold_next(pending, fold, stopped)
+        finally:
+            # при прерывании не начатые пачки отменяются, а выполняемые не ждём:
+            # их ограничивает дедлайн в процессах-работниках
+            pool.shutdown(wait=aborted is None, cancel_futures=True)
+
+    outputs = {}
+    for name in OUTPUTS:
+        band = {'mean': stats[name].mean, 'std': stats[name].std()}
+        band.update(sketches[name].values())
+        outputs[name] = band
+
+    done = stats[next(iter(OUTPUTS))].count
+    if done < samples and aborted is None:
+        # реализации, прерванные дедлайном внутри процесса-работника
+        aborted = 'deadline'
+
+    return {
+        'times': grid,
+        'samples': done,
+        'quantiles': [quantile_key(p) for p in quantiles],
+        'distributions': {k: list(v) for k, v in distributions.items()},
+        'outputs': outputs,
+        'aborted': aborted,
+    }
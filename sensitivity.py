@@ -0,0 +1,316 @@
+"""
+Прямой анализ чувствительности (forward sensitivity) к параметрам модели.
+
+Вместо повторных запусков `run_simulation` с возмущёнными параметрами
+вектор состояния дополняется матрицей чувствительностей S_j = ∂y/∂θ_j,
+которая интегрируется тем же шагом RK4, что и сама траектория:
+
+    dy/dt   = f(t, y; θ)
+    dS_j/dt = J(t, y) · S_j + ∂f/∂θ_j,      S_j(0) = ∂y0/∂θ_j
+
+где J = ∂f/∂y — матрица Якоби правой части `equations.rhs`. Якобиан один на
+все параметры, поэтому каждый дополнительный параметр стоит лишь одного
+умножения матрицы 5×5 на вектор на стадию RK4, а не двух полных прогонов.
+
+Для идеального газа J и ∂f/∂θ вычисляются аналитически; для остальных
+уравнений состояния (`gas_model = 'vdw'`) используются конечные разности.
+
+Поддерживаемые параметры:
+    mu_f, m, V_b, V_emk, valve_tau        — входят в правую часть;
+    rho_b_0, theta_b_0, p_emk_0, theta_emk_0 — только в начальные условия.
+"""
+
+import time
+
+import config as cfg
+from equations import rhs, mass_flow, mass_flow_partials
+from simulation import initial_state
+from solver import rk4_step
+
+# Параметры, от которых зависит правая часть системы ОДУ
+RHS_PARAMS = ('mu_f', 'm', 'V_b', 'V_emk', 'valve_tau')
+# Параметры, входящие только в начальные условия
+INITIAL_PARAMS = ('rho_b_0', 'theta_b_0', 'p_emk_0', 'theta_emk_0')
+PARAMS = RHS_PARAMS + INITIAL_PARAMS
+
+STATE_NAMES = ('p_b', 'T_b', 'p_emk', 'T_emk', 'G')
+N_STATE = len(STATE_NAMES)
+
+
+def _is_ideal():
+    return getattr(cfg, 'gas_model', 'ideal') not in ('vdw',)
+
+
+def _valid(y):
+    return y[0] > 0 and y[1] > 0 and y[2] > 0 and y[3] > 0
+
+
+def jacobian(t, y, f0=None):
+    """
+    Матрица Якоби J[i][k] = ∂f_i/∂y_k правой части `rhs` (5×5).
+    `f0` — уже вычисленное значение rhs(t, y) (нужно только для конечных разностей).
+    """
+    tau = getattr(cfg, 'valve_tau', 0.01)
+    J = [[0.0] * N_STATE for _ in range(N_STATE)]
+    if not _valid(y):
+        # нефизичное состояние: rhs даёт только затухание расхода
+        J[4][4] = -1.0 / tau
+        return J
+    if not _is_ideal():
+        return _jacobian_fd(t, y, f0)
+
+    p_b, T_b, p_emk, T_emk, G = y[:N_STATE]
+    n = cfg.n
+    R = cfg.R
+    V_b = cfg.V_b
+    V_emk = cfg.V_emk
+
+    # Для идеального газа rhs сводится к:
+    #   dp_b/dt   = -n R T_b G / V_b
+    #   dT_b/dt   = -(n-1) R T_b^2 G / (p_b V_b)
+    #   dp_emk/dt =  n R T_b G / V_emk
+    #   dT_emk/dt =  R T_emk (n T_b - T_emk) G / (p_emk V_emk)
+    #   dG/dt     = (G_cmd - G) / tau
+    J[0][1] = -n * R * G / V_b
+    J[0][4] = -n * R * T_b / V_b
+
+    c_b = -(n - 1) * R / V_b
+    J[1][0] = -c_b * T_b ** 2 * G / p_b ** 2
+    J[1][1] = 2 * c_b * T_b * G / p_b
+    J[1][4] = c_b * T_b ** 2 / p_b
+
+    J[2][1] = n * R * G / V_emk
+    J[2][4] = n * R * T_b / V_emk
+
+    c_e = R / (p_emk * V_emk)
+    J[3][1] = c_e * T_emk * n * G
+    J[3][2] = -c_e * T_emk * (n * T_b - T_emk) * G / p_emk
+    J[3][3] = c_e * (n * T_b - 2 * T_emk) * G
+    J[3][4] = c_e * T_emk * (n * T_b - T_emk)
+
+    _, dG_dpb, dG_dTb, dG_dpemk = mass_flow_partials(p_b, T_b, p_emk)
+    J[4][0] = dG_dpb / tau
+    J[4][1] = dG_dTb / tau
+    J[4][2] = dG_dpemk / tau
+    J[4][4] = -1.0 / tau
+    return J
+
+
+def _jacobian_fd(t, y, f0=None):
+    """Якобиан односторонними разностями (для неидеальных уравнений состояния)."""
+    y = list(y[:N_STATE])
+    if f0 is None:
+        f0 = rhs(t, y)
+    J = [[0.0] * N_STATE for _ in range(N_STATE)]
+    for k in range(N_STATE):
+        h = max(1e-7 * abs(y[k]), 1e-10)
+        yk = y.copy()
+        yk[k] += h
+        fk = rhs(t, yk)
+        for i in range(N_STATE):
+            J[i][k] = (fk[i] - f0[i]) / h
+    return J
+
+
+def param_partials(t, y, names, f0=None):
+    """
+    Частные производные правой части по параметрам: {name: ∂f/∂θ (5 значений)}.
+    Для параметров начальных условий производная нулевая.
+    """
+    out = {}
+    fd_names = []
+    for name in names:
+        if name in INITIAL_PARAMS or not _valid(y):
+            out[name] = [0.0] * N_STATE
+        elif _is_ideal() or name in ('mu_f', 'm', 'valve_tau'):
+            out[name] = _param_partial_analytic(y, name)
+        else:
+            fd_names.append(name)
+    if fd_names:
+        if f0 is None:
+            f0 = rhs(t, y)
+        for name in fd_names:
+            out[name] = _param_partial_fd(t, y, name, f0)
+    return out
+
+
+def _param_partial_analytic(y, name):
+    p_b, T_b, p_emk, T_emk, G = y[:N_STATE]
+    tau = getattr(cfg, 'valve_tau', 0.01)
+    d = [0.0] * N_STATE
+
+    if name == 'mu_f':
+        # G_cmd линеен по mu_f
+        if cfg.mu_f != 0:
+            d[4] = mass_flow(p_b, T_b, p_emk) / (cfg.mu_f * tau)
+    elif name == 'm':
+        # m входит только в критический режим, где G_cmd линеен по m
+        n = cfg.n
+        beta = (2 / (n + 1)) ** (n / (n - 1))
+        if p_emk <= beta * p_b and cfg.m != 0:
+            d[4] = mass_flow(p_b, T_b, p_emk) / (cfg.m * tau)
+    elif name == 'valve_tau':
+        d[4] = -(mass_flow(p_b, T_b, p_emk) - G) / tau ** 2
+    elif name == 'V_b':
+        # dp_b/dt и dT_b/dt обратно пропорциональны V_b
+        n = cfg.n
+        R = cfg.R
+        V_b = cfg.V_b
+        d[0] = n * R * T_b * G / V_b ** 2
+        d[1] = (n - 1) * R * T_b ** 2 * G / (p_b * V_b ** 2)
+    elif name == 'V_emk':
+        n = cfg.n
+        R = cfg.R
+        V_emk = cfg.V_emk
+        d[2] = -n * R * T_b * G / V_emk ** 2
+        d[3] = -R * T_emk * (n * T_b - T_emk) * G / (p_emk * V_emk ** 2)
+    return d
+
+
+def _param_partial_fd(t, y, name, f0):
+    theta = getattr(cfg, name)
+    h = max(1e-6 * abs(theta), 1e-12)
+    try:
+        setattr(cfg, name, theta + h)
+        f1 = rhs(t, y[:N_STATE])
+    finally:
+        setattr(cfg, name, theta)
+    return [(f1[i] - f0[i]) / h for i in range(N_STATE)]
+
+
+def initial_sensitivity(name):
+    """S_j(0) = ∂y0/∂θ_j (p_b0 = rho_b_0 * R * theta_b_0)."""
+    s = [0.0] * N_STATE
+    if name == 'rho_b_0':
+        s[0] = cfg.R * cfg.theta_b_0
+    elif name == 'theta_b_0':
+        s[0] = cfg.rho_b_0 * cfg.R
+        s[1] = 1.0
+    elif name == 'p_emk_0':
+        s[2] = 1.0
+    elif name == 'theta_emk_0':
+        s[3] = 1.0
+    return s
+
+
+def _augmented_rhs(names):
+    """Правая часть расширенной системы [y, S_1, ..., S_k] (плоский список)."""
+    rhs_names = [name for name in names if name in RHS_PARAMS]
+
+    def f(t, Y):
+        y = Y[:N_STATE]
+        f0 = rhs(t, y)
+        J = jacobian(t, y, f0)
+        P = param_partials(t, y, rhs_names, f0)
+        out = list(f0)
+        for j, name in enumerate(names):
+            base = N_STATE * (j + 1)
+            S = Y[base:base + N_STATE]
+            dP = P.get(name)
+            for i in range(N_STATE):
+                Ji = J[i]
+                acc = (Ji[0] * S[0] + Ji[1] * S[1] + Ji[2] * S[2]
+                       + Ji[3] * S[3] + Ji[4] * S[4])
+                if dP is not None:
+                    acc += dP[i]
+                out.append(acc)
+        return out
+
+    return f
+
+
+def run_sensitivity(params=None, cancel=None, deadline=None, info=None):
+    """
+    Интегрировать траекторию вместе с чувствительностями ∂y/∂θ.
+
+    params — список имён параметров (по умолчанию все из `PARAMS`).
+    cancel, deadline, info — как в `run_simulation`: при отмене или по
+    истечении дедлайна возвращаются уже посчитанные точки.
+
+    Возвращает:
+        times, results, sens
+    где `times`, `results` совпадают с `run_simulation()`, а
+    sens[name][k] — вектор ∂y/∂θ (5 значений) в момент times[k].
+    """
+    names = list(PARAMS if params is None else params)
+    for name in names:
+        if name not in PARAMS:
+            raise ValueError(f"Неизвестный параметр для анализа чувствительности: {name}")
+
+    t = 0.0
+    dt = cfg.dt
+    t_max = cfg.t_max
+
+    Y = initial_state()
+    for name in names:
+        Y.extend(initial_sensitivity(name))
+
+    f = _augmented_rhs(names)
+
+    times = []
+    results = []
+    sens = {name: [] for name in names}
+
+    wall_start = time.monotonic()
+    check_every = max(1, int(getattr(cfg, 'cancel_check_steps', 256)))
+    steps = 0
+    aborted = None
+
+    while t < t_max:
+        times.append(t)
+        results.append(Y[:N_STATE])
+        for j, name in enumerate(names):
+            base = N_STATE * (j + 1)
+            sens[name].append(Y[base:base + N_STATE])
+
+        if steps % check_every == 0 and (cancel is not None or deadline is not None):
+            if cancel is not None and cancel.is_set():
+                aborted = 'cancelled'
+                break
+            if deadline is not None and time.monotonic() >= deadline:
+                aborted = 'deadline'
+                break
+
+        Y = rk4_step(f, t, Y, dt)
+
+        # Та же защита от обратного потока, что и в `run_simulation`,
+        # вместе с соответствующим преобразованием чувствительностей.
+        p_b, T_b, p_emk, T_emk, G = Y[:N_STATE]
+        if p_emk > p_b:
+            ratio = p_emk / p_b
+            Y[:N_STATE] = [p_b, T_b, p_b, T_emk * ratio, 0.0]
+            for j in range(len(names)):
+                base = N_STATE * (j + 1)
+                s_pb, s_Tb, s_pe, s_Te, _ = Y[base:base + N_STATE]
+                s_Te_new = s_Te * ratio + T_emk * (s_pe / p_b - p_emk * s_pb / p_b ** 2)
+                Y[base:base + N_STATE] = [s_pb, s_Tb, s_pb, s_Te_new, 0.0]
+
+        t += dt
+        steps += 1
+
+    if info is not None:
+        info['steps'] = steps
+        info['wall_time'] = time.monotonic() - wall_start
+        info['aborted'] = aborted
+
+    return times, results, sens
+
+
+def relative_sensitivities(results, sens, index=-1):
+    """
+    Безразмерные чувствительности (θ / y_i) · ∂y_i/∂θ в момент с индексом `index`
+    (по умолчанию — в конце расчёта). Удобны для tornado-диаграмм: значение 0.5
+    означает, что +1 % по параметру даёт +0.5 % по величине.
+
+    Возвращает {name: {state_name: value}}.
+    """
+    y = results[index]
+    out = {}
+    for name, series in sens.items():
+        theta = getattr(cfg, name)
+        s = series[index]
+        out[name] = {
+            STATE_NAMES[i]: (theta * s[i] / y[i] if y[i] != 0 else 0.0)
+            for i in range(N_STATE)
+        }
+    return out
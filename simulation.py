@@ -10,21 +10,175 @@
 Возвращает:
     times, results  (списки временных моментов и соответствующих состояний)
 
+Если задан `output_times`, история шагов не хранится: состояние в
+запрошенные моменты (в пределах [0, t_max]) вычисляется эрмитовой
+интерполяцией внутри шага RK4, и возвращаются ровно эти точки. Плотность
+вывода тогда не зависит от `dt`.
+
+`simulate_dense()` возвращает `DenseSolution` — объект, который можно
+вычислять в любой момент t: он хранит лишь контрольные точки раз в
+`cfg.dense_checkpoint_steps` шагов и при запросе досчитывает нужный отрезок.
+
+Расчёт можно прервать: `cancel` (объект с методом `is_set()`, например
+`threading.Event`) и `deadline` (момент по `time.monotonic()`) проверяются
+каждые `cfg.cancel_check_steps` шагов; при срабатывании возвращаются уже
+посчитанные точки. `max_steps` ограничивает число шагов (пробные запуски
+для оценки стоимости). Если передан словарь `info`, в него записываются
+`steps`, `t_end` (достигнутое время), `wall_time` и `aborted` (None,
+'cancelled', 'deadline' или 'max_steps').
+
+Режим модели `mode` (по умолчанию `cfg.model_mode`):
+    'full'    — полная система из 5 состояний с инерционным клапаном;
+    'reduced' — квазистационарная модель G = G_cmd (4 состояния), шаг
+                выбирается по масштабу выравнивания давлений, а не по valve_tau;
+    'auto'    — переключение между ними по критерию разделения масштабов
+                (`select_model`); моменты переключений — в `info['switches']`.
+В любом режиме состояние возвращается 5-компонентным.
+
 См. `equations.py` для физической модели.
 """
 
+import bisect
+import time
+
 import config as cfg
-from equations import rhs, density
-from solver import rk4_step
+from equations import (rhs, rhs_reduced, density, mass_flow, mass_flow_partials,
+                       pressure_timescale)
+from solver import rk4_step, hermite_interp
+
+# Параметры config.py, от которых зависит правая часть (фиксируются в DenseSolution)
+MODEL_KEYS = ('R', 'n', 'gas_model', 'a_vdw', 'b_vdw', 'M_molar',
+              'V_b', 'V_emk', 'mu_f', 'm', 'valve_tau',
+              'qss_ratio', 'qss_step_fraction', 'qss_dt_max')
+
+MODEL_MODES = ('full', 'reduced', 'auto')
+
+
+def initial_state():
+    """Начальный вектор состояния y0 = [p_b, T_b, p_emk, T_emk, G] по `config.py`."""
+    p_b0 = cfg.rho_b_0 * cfg.R * cfg.theta_b_0
+    return [p_b0, cfg.theta_b_0, cfg.p_emk_0, cfg.theta_emk_0, 0.0]
+
+
+def derivative(t, y, model='full'):
+    """
+    Производная 5-компонентного состояния для выбранной модели.
+    В редуцированной модели G = G_cmd, и dG/dt = ∇G_cmd · dy/dt.
+    """
+    if model == 'full':
+        return rhs(t, y)
+    d = rhs_reduced(t, y)
+    _, dG_dpb, dG_dTb, dG_dpemk = mass_flow_partials(y[0], y[1], y[2])
+    return d + [dG_dpb * d[0] + dG_dTb * d[1] + dG_dpemk * d[2]]
+
+
+def advance(t, y, f, dt, model='full'):
+    """
+    Один шаг RK4 из состояния y с известной производной f = derivative(t, y, model).
+    Возвращает (y_next, f_next), где f_next — производная в конце шага: она служит
+    k1 следующего шага и правой производной для эрмитовой интерполяции.
+    """
+    if model == 'full':
+        y = rk4_step(rhs, t, y, dt, f)
+    else:
+        # редуцированная модель: интегрируются 4 термодинамических состояния
+        y = rk4_step(rhs_reduced, t, y[:4], dt, f[:4])
+        y.append(mass_flow(y[0], y[1], y[2]))
+
+    # Защита: убедиться, что p_b >= p_emk (нет обратного потока)
+    if len(y) >= 5:
+        p_b, T_b, p_emk, T_emk, G = y
+        if p_emk > p_b:
+            # Ограничить p_emk до p_b, чтобы исключить физически невозможное состояние
+            # Сохранить массу постоянной, отрегулировав T_emk
+            # m_emk = p_emk * V / (R * T_emk) = const
+            # => T_emk_new = T_emk * (p_emk_old / p_emk_new)
+            T_emk_corrected = T_emk * (p_emk / p_b)
+            y = [p_b, T_b, p_b, T_emk_corrected, 0.0]  # Остановить поток при выравнивании давлений
+
+    return y, derivative(t + dt, y, model)
+
+
+def select_model(y, model):
+    """
+    Критерий разделения масштабов времени для режима 'auto'.
+
+    Редуцированная модель включается, когда valve_tau < qss_ratio * tau_p
+    (tau_p — масштаб выравнивания давлений) и переходный процесс клапана
+    затух: |G - G_cmd| <= qss_ratio * G_cmd. Обратно к полной модели —
+    при valve_tau > 2 * qss_ratio * tau_p (гистерезис против дребезга).
+    """
+    tau = getattr(cfg, 'valve_tau', 0.01)
+    ratio = cfg.qss_ratio
+    tau_p = pressure_timescale(y)
+    if model == 'full':
+        G_cmd = mass_flow(y[0], y[1], y[2])
+        if tau < ratio * tau_p and abs(y[4] - G_cmd) <= ratio * abs(G_cmd):
+            return 'reduced'
+    elif tau > 2 * ratio * tau_p:
+        return 'full'
+    return model
+
+
+def step(t, y, f, dt, t_max, mode='full', model='full'):
+    """
+    Шаг с выбором модели и величины шага.
+
+    mode — 'full', 'reduced' или 'auto'; model — модель на предыдущем шаге.
+    Полная модель шагает с dt; редуцированная — с шагом qss_step_fraction * tau_p
+    в пределах [dt, qss_dt_max], не выходя за t_max.
+
+    Возвращает (h, y0, f0, y1, f1, model): h — выполненный шаг, (y0, f0) —
+    начальное состояние шага (после возможного переключения модели),
+    (y1, f1) — конечное.
+    """
+    new_model = select_model(y, model) if mode == 'auto' else mode
+    if new_model != model:
+        if new_model == 'reduced':
+            # клапан безынерционен: расход сразу равен командному
+            y = y[:4] + [mass_flow(y[0], y[1], y[2])]
+        model = new_model
+        f = derivative(t, y, model)
+
+    h = dt
+    if model == 'reduced':
+        h = min(max(cfg.qss_step_fraction * pressure_timescale(y), dt), cfg.qss_dt_max)
+        h = min(h, t_max - t)
 
-def run_simulation():
+    y_next, f_next = advance(t, y, f, h, model)
+    return h, y, f, y_next, f_next, model
+
+
+def run_simulation(output_times=None, cancel=None, deadline=None, info=None, mode=None,
+                   max_steps=None):
     t = 0.0
     dt = cfg.dt
     t_max = cfg.t_max
 
+    # Модель: 'full' (5 состояний), 'reduced' (G = G_cmd) или 'auto' (переключение)
+    mode = mode or getattr(cfg, 'model_mode', 'full')
+    if mode not in MODEL_MODES:
+        raise ValueError(f"Неизвестный режим модели: {mode}")
+    model = 'full' if mode == 'auto' else mode
+    switches = []
+
+    # Моменты вывода (по возрастанию); None -> сохраняется каждый шаг
+    out_times = None
+    if output_times is not None:
+        out_times = sorted(float(x) for x in output_times if 0.0 <= x)
+        j_out = 0
+
+    wall_start = time.monotonic()
+    check_every = max(1, int(getattr(cfg, 'cancel_check_steps', 256)))
+    steps = 0
+    aborted = None
+
     # Начальные условия
-    p_b0 = cfg.rho_b_0 * cfg.R * cfg.theta_b_0
-    y = [p_b0, cfg.theta_b_0, cfg.p_emk_0, cfg.theta_emk_0, 0.0]
+    y = initial_state()
+    if model == 'reduced':
+        y[4] = mass_flow(y[0], y[1], y[2])
+    f = derivative(t, y, model)
+    p_b0 = y[0]
 
     times = []
     results = []
@@ -38,8 +192,21 @@ def run_simulation():
     # Периодический вывод состояния
     next_print = 0.0
     while t < t_max:
-        times.append(t)
-        results.append(y.copy())
+        if out_times is None:
+            times.append(t)
+            results.append(y.copy())
+
+        # Кооперативная отмена и ограничение по времени
+        if steps % check_every == 0 and (cancel is not None or deadline is not None):
+            if cancel is not None and cancel.is_set():
+                aborted = 'cancelled'
+                break
+            if deadline is not None and time.monotonic() >= deadline:
+                aborted = 'deadline'
+                break
+        if max_steps is not None and steps >= max_steps:
+            aborted = 'max_steps'
+            break
 
         # Вывод состояния в указанные интервалы
         if t >= next_print - 1e-12:
@@ -58,21 +225,32 @@ def run_simulation():
             # print(f"            p_emk={p_emk:10.3e} Pa, T_emk={T_emk:7.2f} K, rho_emk={rho_emk:8.3f} kg/m^3")
             next_print += cfg.print_interval
 
-        # Выполнить один шаг интегрирования RK4
-        y = rk4_step(rhs, t, y, dt)
-        
-        # Защита: убедиться, что p_b >= p_emk (нет обратного потока)
-        if len(y) >= 5:
-            p_b, T_b, p_emk, T_emk, G = y
-            if p_emk > p_b:
-                # Ограничить p_emk до p_b, чтобы исключить физически невозможное состояние
-                # Сохранить массу постоянной, отрегулировав T_emk
-                # m_emk = p_emk * V / (R * T_emk) = const
-                # => T_emk_new = T_emk * (p_emk_old / p_emk_new)
-                T_emk_corrected = T_emk * (p_emk / p_b)
-                y = [p_b, T_b, p_b, T_emk_corrected, 0.0]  # Остановить поток при выравнивании давлений
-        
-        t += dt
+        # Выполнить один шаг интегрирования RK4 (с выбором модели в режиме 'auto')
+        h, y, f, y_next, f_next, new_model = step(t, y, f, dt, t_max, mode, model)
+        if new_model != model:
+            switches.append((t, new_model))
+            model = new_model
+
+        # Выборка в заданные моменты внутри шага [t, t + h]
+        if out_times is not None:
+            t_next = t + h
+            while j_out < len(out_times) and out_times[j_out] <= t_next:
+                t_out = out_times[j_out]
+                if t_out <= t_max + 1e-12:
+                    times.append(t_out)
+                    results.append(hermite_interp(t, y, f, t_next, y_next, f_next, t_out))
+                j_out += 1
+
+        y, f = y_next, f_next
+        t += h
+        steps += 1
+
+    if info is not None:
+        info['steps'] = steps
+        info['t_end'] = t
+        info['wall_time'] = time.monotonic() - wall_start
+        info['aborted'] = aborted
+        info['switches'] = switches
 
     # Финальные значения
     if len(y) >= 5:
@@ -93,4 +271,124 @@ def run_simulation():
     return times, results
 
 
+class DenseSolution:
+    """
+    Решение с непрерывным продолжением: sol(t) -> [p_b, T_b, p_emk, T_emk, G].
+
+    Хранит только контрольные точки (t, y, f) раз в `every` шагов. При
+    запросе момента t досчитывается не более `every` шагов от ближайшей
+    контрольной точки (результат совпадает с исходным расчётом побитно),
+    последний досчитанный отрезок кэшируется, так что последовательные
+    запросы по возрастанию t почти ничего не стоят.
+    """
+
+    def __init__(self, dt, t_end, checkpoints, every, params, mode='full', t_max=None):
+        self.dt = dt
+        self.t_end = t_end
+        # решение определено на [0, t_max]; последний шаг может выйти за t_max
+        self.t_max = t_end if t_max is None else min(t_max, t_end)
+        self.mode = mode
+        self.every = every
+        self._checkpoints = checkpoints
+        self._checkpoint_times = [c[0] for c in checkpoints]
+        self._params = params
+        self._segment_index = None
+        self._segment = None
+
+    def _load_segment(self, index):
+        if self._segment_index == index:
+            return self._segment
+        t, y, f, model = self._checkpoints[index]
+        nodes = [(t, y, f)]
+        # модель могла быть переопределена после расчёта: временно вернуть параметры решения
+        snap = {k: getattr(cfg, k, None) for k in self._params}
+        try:
+            for k, v in self._params.items():
+                setattr(cfg, k, v)
+            for _ in range(self.every):
+                if t >= self.t_end - 1e-12:
+                    break
+                h, y0, f0, y, f, model = step(t, y, f, self.dt, self.t_end, self.mode, model)
+                if y0 is not nodes[-1][1]:
+                    # при переключении модели начало шага меняется
+                    nodes[-1] = (t, y0, f0)
+                t += h
+                nodes.append((t, y, f))
+        finally:
+            for k, v in snap.items():
+                setattr(cfg, k, v)
+        self._segment_index = index
+        self._segment = nodes
+        return nodes
+
+    def __call__(self, t):
+        if t < 0.0 or t > self.t_max + 1e-12:
+            raise ValueError(f"t = {t} вне интервала решения [0, {self.t_max}]")
+        index = max(0, bisect.bisect_right(self._checkpoint_times, t) - 1)
+        nodes = self._load_segment(index)
+        k = 0
+        while k + 1 < len(nodes) - 1 and nodes[k + 1][0] <= t:
+            k += 1
+        if len(nodes) == 1:
+            return list(nodes[0][1])
+        (t0, y0, f0), (t1, y1, f1) = nodes[k], nodes[k + 1]
+        return hermite_interp(t0, y0, f0, t1, y1, f1, t)
+
+    def sample(self, times):
+        """Состояния в моменты `times` (список списков, как `results`)."""
+        return [self(t) for t in times]
+
+
+def simulate_dense(checkpoint_every=None, cancel=None, deadline=None, info=None, mode=None):
+    """
+    Проинтегрировать систему до t_max и вернуть `DenseSolution`.
+    Отмена, дедлайн и режим модели — как в `run_simulation`; при прерывании
+    решение определено до последнего выполненного шага.
+    """
+    every = max(1, int(checkpoint_every or getattr(cfg, 'dense_checkpoint_steps', 64)))
+    check_every = max(1, int(getattr(cfg, 'cancel_check_steps', 256)))
+    wall_start = time.monotonic()
+
+    mode = mode or getattr(cfg, 'model_mode', 'full')
+    if mode not in MODEL_MODES:
+        raise ValueError(f"Неизвестный режим модели: {mode}")
+    model = 'full' if mode == 'auto' else mode
+    switches = []
+
+    t = 0.0
+    dt = cfg.dt
+    t_max = cfg.t_max
+    y = initial_state()
+    if model == 'reduced':
+        y[4] = mass_flow(y[0], y[1], y[2])
+    f = derivative(t, y, model)
+
+    # контрольная точка в t = 0 есть всегда (даже при t_max <= 0)
+    checkpoints = [(t, y, f, model)]
+    steps = 0
+    aborted = None
+    while t < t_max:
+        if steps and steps % every == 0:
+            checkpoints.append((t, y, f, model))
+        if steps % check_every == 0:
+            if cancel is not None and cancel.is_set():
+                aborted = 'cancelled'
+                break
+            if deadline is not None and time.monotonic() >= deadline:
+                aborted = 'deadline'
+                break
+        h, _, _, y, f, new_model = step(t, y, f, dt, t_max, mode, model)
+        if new_model != model:
+            switches.append((t, new_model))
+            model = new_model
+        t += h
+        steps += 1
+
+    if info is not None:
+        info['steps'] = steps
+        info['wall_time'] = time.monotonic() - wall_start
+        info['aborted'] = aborted
+        info['switches'] = switches
 
+    params = {k: getattr(cfg, k, None) for k in MODEL_KEYS}
+    return DenseSolution(dt, t, checkpoints, every, params, mode, t_max=max(t_max, 0.0))
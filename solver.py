@@ -6,16 +6,38 @@
 зависимостей, чтобы численное поведение было прозрачно для задания.
 
 Сигнатура:
-    rk4_step(f, t, y, dt) -> y_next
+    rk4_step(f, t, y, dt, k1=None) -> y_next
 
 Здесь `f(t, y)` возвращает список производных той же длины, что и `y`.
+Если `k1 = f(t, y)` уже известно (например, производная в конце
+предыдущего шага), его можно передать, чтобы не вычислять повторно.
+
+Непрерывное продолжение (dense output):
+    hermite_interp(t0, y0, f0, t1, y1, f1, t) -> y(t)
+
+кубический эрмитов интерполянт по значениям и производным на концах шага;
+его погрешность O(dt^4) согласована с порядком RK4.
 """
 
-def rk4_step(f, t, y, dt):
-    k1 = f(t, y)
+def rk4_step(f, t, y, dt, k1=None):
+    if k1 is None:
+        k1 = f(t, y)
     k2 = f(t + dt/2, [y[i] + dt*k1[i]/2 for i in range(len(y))])
     k3 = f(t + dt/2, [y[i] + dt*k2[i]/2 for i in range(len(y))])
     k4 = f(t + dt,   [y[i] + dt*k3[i]   for i in range(len(y))])
 
     return [y[i] + dt*(k1[i] + 2*k2[i] + 2*k3[i] + k4[i]) / 6
             for i in range(len(y))]
+
+
+def hermite_interp(t0, y0, f0, t1, y1, f1, t):
+    h = t1 - t0
+    s = (t - t0) / h
+    s2 = s * s
+    s3 = s2 * s
+    h00 = 2*s3 - 3*s2 + 1
+    h10 = (s3 - 2*s2 + s) * h
+    h01 = -2*s3 + 3*s2
+    h11 = (s3 - s2) * h
+    return [h00*y0[i] + h10*f0[i] + h01*y1[i] + h11*f1[i]
+            for i in range(len(y0))]
@@ -6,13 +6,59 @@ _PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 if _PROJECT_ROOT not in sys.path:
     sys.path.insert(0, _PROJECT_ROOT)
 
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, render_template, request, jsonify, g
+from werkzeug.exceptions import HTTPException
+import json
 import threading
 import time
 import importlib
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from contextlib import contextmanager
+
+from cost import CostModel, estimate_steps, probe_run
+import metrics
 
 app = Flask(__name__, template_folder='templates', static_folder='static')
 
+# ===== Метрики (GET /metrics, формат Prometheus) =====
+_metrics = metrics.Registry()
+_m_request_latency = _metrics.histogram(
+    'http_request_duration_seconds', 'Request latency by route', ('route', 'method'))
+_m_requests = _metrics.counter(
+    'http_requests_total', 'Requests by route and status', ('route', 'method', 'status'))
+_m_response_bytes = _metrics.histogram(
+    'http_response_size_bytes', 'Response payload size by route', ('route',), metrics.SIZE_BUCKETS)
+_m_errors = _metrics.counter(
+    'http_errors_total', 'Error responses by type', ('type',))
+# kind: run (/api/run), sensitivity, montecarlo; метки — только проверенные значения
+_m_sim_wall = _metrics.histogram(
+    'simulation_wall_seconds', 'Wall time of one computation by kind',
+    ('kind', 'gas_model', 'model_mode'))
+_m_sim_steps = _metrics.histogram(
+    'simulation_steps', 'Integrator steps per computation (run, sensitivity)',
+    ('kind', 'gas_model', 'model_mode'), metrics.STEPS_BUCKETS)
+_m_sim_runs = _metrics.counter(
+    'simulation_runs_total', 'Computations by kind and outcome (ok, cancelled, deadline)',
+    ('kind', 'gas_model', 'outcome'))
+_m_sim_in_flight = _metrics.gauge(
+    'simulation_runs_in_flight', 'Computations currently executing or waiting for the config lock', ('kind',))
+_m_serialize = _metrics.histogram(
+    'api_run_serialize_seconds', 'JSON serialization time of /api/run responses')
+_m_coalesced = _metrics.counter(
+    'simulation_runs_coalesced_total', 'Requests that shared an in-flight run (runs saved)')
+_m_started = _metrics.counter(
+    'simulation_runs_started_total', 'Runs actually started by /api/run')
+# счётчики без меток экспортируются с нуля, чтобы rate() видел первый запуск
+_m_coalesced.inc(0)
+_m_started.inc(0)
+_m_queued = _metrics.gauge(
+    'simulation_queued_estimated_seconds', 'Estimated seconds of admitted (running and queued) runs')
+
+# Параметры config.py, которые клиент может читать и переопределять
+# (нечисловые — в TEXT_PARAM_KEYS: по ним нельзя задавать распределения Монте-Карло)
+PARAM_KEYS = ['R', 'n', 'V_b', 'V_emk', 'mu_f', 'm', 'rho_b_0', 'theta_b_0', 'p_emk_0', 'theta_emk_0', 't_max', 'dt', 'valve_tau', 'gas_model', 'a_vdw', 'b_vdw', 'M_molar', 'model_mode']
+TEXT_PARAM_KEYS = ('gas_model', 'model_mode')
+
 
 def snapshot_cfg(keys):
     import config as cfg
@@ -28,6 +74,46 @@ def restore_cfg(snap):
         setattr(cfg, k, v)
 
 
+@app.before_request
+def _start_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+def _record_request(response):
+    started = g.pop('request_started', None)
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    if started is not None:
+        _m_request_latency.observe(time.perf_counter() - started, route=route, method=request.method)
+    _m_requests.inc(route=route, method=request.method, status=response.status_code)
+    size = response.calculate_content_length()
+    if size is not None:
+        _m_response_bytes.observe(size, route=route)
+    if response.status_code >= 400:
+        _m_errors.inc(type=g.pop('error_type', None) or f'http_{response.status_code}')
+    return response
+
+
+@app.errorhandler(Exception)
+def _handle_exception(e):
+    if isinstance(e, HTTPException):
+        g.error_type = type(e).__name__
+        return e
+    g.error_type = type(e).__name__
+    app.logger.exception('Unhandled error')
+    return jsonify({'error': 'internal error', 'type': type(e).__name__}), 500
+
+
+def _collect_run_stats():
+    _m_queued.set(_admission.stats()['queued_estimated_s'])
+
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    body = _metrics.render()
+    return app.response_class(body, mimetype=None, content_type=metrics.CONTENT_TYPE)
+
+
 @app.route('/')
 def index():
     return render_template('index.html')
@@ -36,54 +122,291 @@ def index():
 @app.route('/api/params', methods=['GET'])
 def get_params():
     import config as cfg
-    keys = ['R', 'n', 'V_b', 'V_emk', 'mu_f', 'm', 'rho_b_0', 'theta_b_0', 'p_emk_0', 'theta_emk_0', 't_max', 'dt', 'valve_tau', 'gas_model', 'a_vdw', 'b_vdw', 'M_molar']
-    out = {k: getattr(cfg, k, None) for k in keys}
+    out = {k: getattr(cfg, k, None) for k in PARAM_KEYS}
     return jsonify(out)
 
 
-@app.route('/api/run', methods=['POST'])
-def run_simulation_api():
-    data = request.get_json() or {}
-    # Allowed overrides
-    allowed = ['R', 'n', 'V_b', 'V_emk', 'mu_f', 'm', 'rho_b_0', 'theta_b_0', 'p_emk_0', 'theta_emk_0', 't_max', 'dt', 'valve_tau', 'gas_model', 'a_vdw', 'b_vdw', 'M_molar']
+def canonical_params(data):
+    """
+    Полный набор параметров запуска: значения config.py с наложенными
+    переопределениями клиента. Числа приводятся к float, чтобы 250 и 250.0
+    давали один и тот же ключ.
+    """
     import config as cfg
-    # snapshot
-    snap = snapshot_cfg(allowed)
-    # apply overrides
-    for k in allowed:
-        if k in data:
-            try:
-                val = data[k]
-                # if incoming is string 'ideal' or 'vdw', keep as string
-                setattr(cfg, k, val)
-            except Exception:
-                pass
+    params = {}
+    for k in PARAM_KEYS:
+        val = data[k] if k in data else getattr(cfg, k, None)
+        if isinstance(val, (int, float)) and not isinstance(val, bool):
+            val = float(val)
+        params[k] = val
+    return params
 
-    # run simulation
-    from simulation import run_simulation
+
+def invalid_params(params):
+    """Сообщение об ошибке для недопустимых значений параметров или None."""
+    from equations import GAS_MODELS
+    from simulation import MODEL_MODES
+    if params.get('gas_model') not in GAS_MODELS:
+        return f"unknown gas_model: {params.get('gas_model')!r}, expected one of {list(GAS_MODELS)}"
+    if params.get('model_mode') not in MODEL_MODES:
+        return f"unknown model_mode: {params.get('model_mode')!r}, expected one of {list(MODEL_MODES)}"
+    return None
+
+
+def invalid_distributions(distributions):
+    """
+    Проверить распределения Монте-Карло {name: [kind, width]}: только числовые
+    параметры, kind — 'normal' или 'uniform', width >= 0. Сообщение или None.
+    """
+    if not isinstance(distributions, dict):
+        return 'distributions must be an object {name: [kind, width]}'
+    bad = [k for k in distributions if k not in PARAM_KEYS or k in TEXT_PARAM_KEYS]
+    if bad:
+        return f'unknown params: {bad}'
+    for name, spec in distributions.items():
+        if (not isinstance(spec, (list, tuple)) or len(spec) != 2
+                or spec[0] not in ('normal', 'uniform')
+                or not isinstance(spec[1], (int, float)) or isinstance(spec[1], bool)
+                or not spec[1] >= 0):
+            return f"invalid distribution for {name}: {spec!r}, expected ['normal'|'uniform', width >= 0]"
+    return None
+
+
+class SingleFlight:
+    """
+    Объединение одинаковых одновременных вычислений (single-flight).
+
+    Пока вычисление с ключом `key` выполняется, повторные вызовы с тем же
+    ключом не запускают его заново, а ждут и получают тот же результат
+    (или то же исключение).
+    """
+
+    class _Call:
+        def __init__(self):
+            self.done = threading.Event()
+            self.cancel = threading.Event()
+            self.result = None
+            self.error = None
+            self.run_ids = set()
+            self.waiters = 0
+
+    def __init__(self, on_start=None, on_coalesce=None):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.started = 0     # реально выполненных вычислений
+        self.coalesced = 0   # запросов, получивших чужой результат (сэкономленные запуски)
+        # необязательные обработчики для счётчиков метрик
+        self.on_start = on_start
+        self.on_coalesce = on_coalesce
+
+    def do(self, key, fn, run_id=None):
+        """
+        Вернуть (result, shared): shared=True, если результат получен от другого запроса.
+
+        `fn(cancel)` получает событие отмены общего вычисления; оно
+        устанавливается, когда все ожидающие запросы отменены через `cancel()`.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = SingleFlight._Call()
+                self.started += 1
+                if self.on_start is not None:
+                    self.on_start()
+            else:
+                self.coalesced += 1
+                if self.on_coalesce is not None:
+                    self.on_coalesce()
+            call.waiters += 1
+            if run_id is not None:
+                call.run_ids.add(run_id)
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn(call.cancel)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                # ключ мог быть уже освобождён отменой и занят новым вычислением
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    def cancel(self, run_id):
+        """Отказаться от результата для запроса `run_id`. Возвращает True, если он найден."""
+        with self._lock:
+            for key, call in self._calls.items():
+                if run_id in call.run_ids:
+                    call.run_ids.discard(run_id)
+                    call.waiters -= 1
+                    if call.waiters <= 0:
+                        call.cancel.set()
+                        # новый такой же запрос не должен присоединиться к отменённому
+                        # расчёту: он запустит свой, пока этот ещё останавливается
+                        del self._calls[key]
+                    return True
+        return False
+
+    def stats(self):
+        with self._lock:
+            return {
+                'runs_started': self.started,
+                'runs_coalesced': self.coalesced,
+                'in_flight': len(self._calls),
+            }
+
+
+class Overloaded(Exception):
+    """Суммарная оценка выполняемых и ожидающих расчётов превышает бюджет очереди."""
+
+
+class OverBudget(Exception):
+    """Оценка времени одного расчёта больше `cfg.web_run_budget_s`."""
+
+    def __init__(self, steps, seconds):
+        super().__init__(steps, seconds)
+        self.steps = steps
+        self.seconds = seconds
+
+
+class QueueTimeout(Overloaded):
+    """Расчёт не дождался освобождения config.py до своего дедлайна."""
+
+
+class AdmissionControl:
+    """
+    Допуск расчётов по оценке стоимости. Каждый допущенный расчёт резервирует
+    свою оценку времени до завершения; если сумма превысила бы
+    `cfg.web_queue_budget_s`, новый расчёт не ставится в очередь.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.pending_s = 0.0
+        self.rejected_budget = 0
+        self.rejected_queue = 0
+
+    def acquire(self, seconds):
+        import config as cfg
+        with self._lock:
+            # пустая очередь принимает любой расчёт в пределах бюджета одного запуска
+            if self.pending_s > 0 and self.pending_s + seconds > cfg.web_queue_budget_s:
+                self.rejected_queue += 1
+                raise Overloaded(seconds)
+            self.pending_s += seconds
+
+    def release(self, seconds):
+        with self._lock:
+            self.pending_s = max(0.0, self.pending_s - seconds)
+
+    def reject_over_budget(self):
+        with self._lock:
+            self.rejected_budget += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'queued_estimated_s': self.pending_s,
+                'rejected_over_budget': self.rejected_budget,
+                'rejected_queue_full': self.rejected_queue,
+            }
+
+
+# config.py — общее состояние модуля: переопределение параметров и расчёт
+# выполняются под одной блокировкой, чтобы параллельные запросы не смешивали параметры
+_cfg_lock = threading.Lock()
+_run_flight = SingleFlight(on_start=_m_started.inc, on_coalesce=_m_coalesced.inc)
+# /api/sensitivity и /api/montecarlo: объединение одинаковых запросов и отмена по run_id
+_analysis_flight = SingleFlight()
+_admission = AdmissionControl()
+_cost_model = CostModel()
+_metrics.add_collector(_collect_run_stats)
+
+
+@contextmanager
+def _config_locked(deadline=None):
+    """Захватить `_cfg_lock`, ожидая не дольше дедлайна (иначе `QueueTimeout`)."""
+    timeout = -1 if deadline is None else max(0.0, deadline - time.monotonic())
+    if not _cfg_lock.acquire(timeout=timeout):
+        raise QueueTimeout()
     try:
-        times, results = run_simulation()
+        yield
     finally:
-        # restore config
-        restore_cfg(snap)
+        _cfg_lock.release()
 
-    # Format data
-    p_b = [r[0] for r in results]
-    T_b = [r[1] for r in results]
-    p_emk = [r[2] for r in results]
-    T_emk = [r[3] for r in results]
-    G = [r[4] if len(r) > 4 else 0.0 for r in results]
 
-    # compute densities using current EOS implementation
+@contextmanager
+def _tracked(kind, params):
+    """
+    Метрики одного расчёта: число выполняющихся и, при успешном завершении,
+    время, шаги и исход. Расчёт заполняет выданный словарь как `info`
+    в `run_simulation` (steps, wall_time, aborted); отсутствующие поля
+    не учитываются, время по умолчанию замеряется здесь.
+    """
+    from equations import GAS_MODELS
+    from simulation import MODEL_MODES
+    gas_model = params.get('gas_model')
+    model_mode = params.get('model_mode')
+    labels = {
+        'kind': kind,
+        'gas_model': gas_model if gas_model in GAS_MODELS else 'other',
+        'model_mode': model_mode if model_mode in MODEL_MODES else 'other',
+    }
+    info = {}
+    started = time.monotonic()
+    _m_sim_in_flight.inc(kind=kind)
     try:
-        from equations import density
-        rho_b = [density(p, T) for p, T in zip(p_b, T_b)]
-        rho_emk = [density(p, T) for p, T in zip(p_emk, T_emk)]
-    except Exception:
-        rho_b = []
-        rho_emk = []
+        yield info
+    finally:
+        _m_sim_in_flight.dec(kind=kind)
+    _m_sim_wall.observe(info.get('wall_time', time.monotonic() - started), **labels)
+    if 'steps' in info:
+        _m_sim_steps.observe(info['steps'], **labels)
+    _m_sim_runs.inc(kind=kind, gas_model=labels['gas_model'], outcome=info.get('aborted') or 'ok')
 
-    return jsonify({
+
+def compute_run(params, cancel=None, deadline=None, output_times=None):
+    """
+    Выполнить симуляцию с полным набором параметров и подготовить ответ /api/run.
+    `output_times` — моменты вывода (по умолчанию каждый шаг интегрирования).
+    """
+    import config as cfg
+    from simulation import run_simulation
+    from equations import density
+
+    with _tracked('run', params) as info:
+        with _config_locked(deadline):
+            snap = snapshot_cfg(PARAM_KEYS)
+            try:
+                for k, v in params.items():
+                    setattr(cfg, k, v)
+                times, results = run_simulation(output_times=output_times, cancel=cancel,
+                                                deadline=deadline, info=info)
+
+                # Format data
+                p_b = [r[0] for r in results]
+                T_b = [r[1] for r in results]
+                p_emk = [r[2] for r in results]
+                T_emk = [r[3] for r in results]
+                G = [r[4] if len(r) > 4 else 0.0 for r in results]
+
+                # densities use the EOS selected for this run (before config is restored)
+                rho_b = [density(p, T) for p, T in zip(p_b, T_b)]
+                rho_emk = [density(p, T) for p, T in zip(p_emk, T_emk)]
+            finally:
+                # restore config
+                restore_cfg(snap)
+
+    return {
         'times': times,
         'p_b': p_b,
         'T_b': T_b,
@@ -92,8 +415,381 @@ def run_simulation_api():
         'G': G,
         'rho_b': rho_b,
         'rho_emk': rho_emk,
+        'steps': info['steps'],
+        'wall_time': info['wall_time'],
+        'aborted': info['aborted'],
+        'model_switches': info['switches'],
+    }
+
+
+_probe_pool = None
+_probe_pool_lock = threading.Lock()
+
+
+def _probe_run(params, deadline=None):
+    """
+    (t_reached, steps) пробного запуска из `cfg.cost_probe_steps` шагов.
+
+    Проба выполняется в отдельном процессе со своим config.py, поэтому не ждёт
+    `_cfg_lock`, занятый текущими расчётами; результаты кэшируются в `_cost_model`.
+    """
+    global _probe_pool
+    import config as cfg
+
+    probe = _cost_model.cached_probe(params)
+    if probe is not None:
+        return probe
+    with _probe_pool_lock:
+        if _probe_pool is None:
+            _probe_pool = ProcessPoolExecutor(max_workers=1)
+    future = _probe_pool.submit(probe_run, params, cfg.cost_probe_steps)
+    timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+    try:
+        probe = future.result(timeout=timeout)
+    except FutureTimeout:
+        future.cancel()
+        raise QueueTimeout()
+    _cost_model.store_probe(params, probe)
+    return probe
+
+
+def estimate_run(params, deadline=None):
+    """
+    Оценка (steps, seconds) для полного набора параметров.
+
+    В режимах 'auto' и 'reduced' шаг переменный и t_max/dt — лишь верхняя
+    граница; если она больше пробного запуска, число шагов экстраполируется
+    по нему (`_probe_run`, не дольше `deadline`).
+    """
+    import config as cfg
+    steps, seconds = _cost_model.estimate(params['t_max'], params['dt'], params['gas_model'])
+    if params.get('model_mode', 'full') != 'full' and steps > cfg.cost_probe_steps:
+        probe = _probe_run(params, deadline)
+        steps, seconds = _cost_model.estimate(params['t_max'], params['dt'], params['gas_model'], probe)
+    return steps, seconds
+
+
+def _admitted(seconds, fn):
+    """Обернуть расчёт резервом `seconds` в очереди допуска (на время выполнения)."""
+    def run(cancel):
+        _admission.acquire(seconds)
+        try:
+            return fn(cancel)
+        finally:
+            _admission.release(seconds)
+    return run
+
+
+def _leader_run(params, deadline, output_times=None):
+    """
+    Расчёт, выполняемый первым из одинаковых запросов: оценка стоимости
+    (с пробой для 'auto'/'reduced'), проверка бюджета, резерв в очереди,
+    запуск, замер. Присоединившиеся запросы получают тот же результат или
+    то же исключение (`OverBudget`, `Overloaded`).
+    """
+    import config as cfg
+
+    def run(cancel):
+        steps, seconds = estimate_run(params, deadline)
+        if seconds > cfg.web_run_budget_s:
+            raise OverBudget(steps, seconds)
+        _admission.acquire(seconds)
+        try:
+            payload = compute_run(params, cancel=cancel, deadline=deadline,
+                                  output_times=output_times)
+        finally:
+            _admission.release(seconds)
+        _cost_model.observe(params['gas_model'], payload['steps'], payload['wall_time'])
+        if not payload['aborted']:
+            # фактическое число шагов — точная оценка для повторных запросов
+            _cost_model.store_probe(params, (params['t_max'], payload['steps']))
+        return payload
+    return run
+
+
+def _invalid_response(params):
+    """Ответ 400 для недопустимых параметров (включая t_max/dt) или None."""
+    error = invalid_params(params)
+    if error is None:
+        try:
+            estimate_steps(params['t_max'], params['dt'])
+        except (TypeError, ValueError) as e:
+            error = f'invalid t_max/dt: {e}'
+    if error is not None:
+        g.error_type = 'invalid_params'
+        return jsonify({'error': error}), 400
+    return None
+
+
+def _over_budget_response(steps, seconds):
+    import config as cfg
+    _admission.reject_over_budget()
+    g.error_type = 'over_budget'
+    return jsonify({
+        'error': 'run exceeds budget',
+        'estimated_steps': steps,
+        'estimated_seconds': seconds,
+        'budget_seconds': cfg.web_run_budget_s,
+    }), 422
+
+
+def _estimate(params, deadline=None):
+    """
+    Проверить параметры и оценить стоимость одного расчёта.
+    Возвращает (steps, seconds, None) или (None, None, ответ с ошибкой 400/503).
+    """
+    error = _invalid_response(params)
+    if error is not None:
+        return None, None, error
+    try:
+        steps, seconds = estimate_run(params, deadline)
+    except QueueTimeout:
+        return None, None, _busy_response(None)
+    except (TypeError, ValueError) as e:
+        g.error_type = 'invalid_params'
+        return None, None, (jsonify({'error': f'invalid t_max/dt: {e}'}), 400)
+    return steps, seconds, None
+
+
+def _check_budget(params, factor=1.0, deadline=None):
+    """
+    Оценить стоимость (шаги одного расчёта × factor) и проверить бюджет запуска.
+    Возвращает (steps, seconds, None) или (None, None, ответ с ошибкой 400/422/503).
+    """
+    import config as cfg
+    steps, seconds, error = _estimate(params, deadline)
+    if error is not None:
+        return None, None, error
+    steps = int(steps * factor)
+    seconds *= factor
+    if seconds > cfg.web_run_budget_s:
+        return None, None, _over_budget_response(steps, seconds)
+    return steps, seconds, None
+
+
+def _busy_response(seconds):
+    """503 при переполнении очереди или истечении дедлайна в ожидании config."""
+    g.error_type = 'queue_full'
+    queued = _admission.stats()['queued_estimated_s']
+    response = jsonify({
+        'error': 'server busy',
+        'estimated_seconds': seconds,
+        'queued_estimated_s': queued,
+    })
+    response.status_code = 503
+    response.headers['Retry-After'] = str(int(max(1, queued)))
+    return response
+
+
+@app.route('/api/run', methods=['POST'])
+def run_simulation_api():
+    import config as cfg
+    started = time.monotonic()
+    data = request.get_json() or {}
+    params = canonical_params(data)
+    deadline = started + cfg.web_run_timeout_s
+
+    # необязательные моменты вывода: состояние интерполируется внутри шага
+    output_times = data.get('output_times')
+    if output_times is not None:
+        if not isinstance(output_times, list) or len(output_times) > cfg.max_output_times:
+            g.error_type = 'invalid_params'
+            return jsonify({'error': f'output_times must be a list of at most '
+                                     f'{cfg.max_output_times} numbers'}), 400
+        try:
+            output_times = sorted(float(x) for x in output_times)
+        except (TypeError, ValueError):
+            g.error_type = 'invalid_params'
+            return jsonify({'error': 'output_times must be a list of numbers'}), 400
+
+    error = _invalid_response(params)
+    if error is not None:
+        return error
+
+    key = json.dumps([params, output_times], sort_keys=True)
+
+    # одинаковые одновременные запросы разделяют один расчёт; оценка стоимости
+    # (число шагов при измеренной скорости) выполняется внутри него, один раз
+    try:
+        payload, shared = _run_flight.do(key, _leader_run(params, deadline, output_times),
+                                         run_id=data.get('run_id'))
+    except OverBudget as e:
+        return _over_budget_response(e.steps, e.seconds)
+    except Overloaded as e:
+        return _busy_response(e.args[0] if e.args else None)
+
+    # сериализация ответа замеряется отдельно: для длинных рядов она сравнима с расчётом
+    t0 = time.perf_counter()
+    body = app.json.dumps(payload) + '\n'
+    _m_serialize.observe(time.perf_counter() - t0)
+
+    response = app.response_class(body, mimetype=app.json.mimetype)
+    response.headers['X-Run-Coalesced'] = '1' if shared else '0'
+    return response
+
+
+@app.route('/api/cancel', methods=['POST'])
+def cancel_run_api():
+    """
+    Отменить ожидание результата запроса с `run_id` (JSON или тело запроса
+    из navigator.sendBeacon). Общий расчёт прерывается, когда от него
+    отказались все ожидающие запросы.
+    """
+    data = request.get_json(silent=True) or {}
+    run_id = data.get('run_id') or request.get_data(as_text=True)
+    cancelled = bool(run_id) and (_run_flight.cancel(run_id) or _analysis_flight.cancel(run_id))
+    return jsonify({'cancelled': cancelled})
+
+
+@app.route('/api/estimate', methods=['POST'])
+def estimate_run_api():
+    """Оценка стоимости расчёта без запуска (те же параметры, что и /api/run)."""
+    import config as cfg
+    params = canonical_params(request.get_json() or {})
+    steps, seconds, error = _estimate(params, time.monotonic() + cfg.web_run_timeout_s)
+    if error is not None:
+        return error
+    return jsonify({
+        'estimated_steps': steps,
+        'estimated_seconds': seconds,
+        'budget_seconds': cfg.web_run_budget_s,
+        'admissible': seconds <= cfg.web_run_budget_s,
     })
 
 
+@app.route('/api/stats', methods=['GET'])
+def get_stats():
+    """Счётчики объединения запросов, допуска и измеренная производительность."""
+    out = _run_flight.stats()
+    out.update(_admission.stats())
+    out['steps_per_sec'] = _cost_model.rates()
+    return jsonify(out)
+
+
+@app.route('/api/sensitivity', methods=['POST'])
+def run_sensitivity_api():
+    """
+    Прямой анализ чувствительности: ∂y/∂θ для выбранных параметров.
+    JSON: переопределения параметров (как в /api/run) и необязательный
+    список `params`. Ответ содержит ряды ∂y/∂θ и безразмерные
+    чувствительности в конце расчёта (`tornado`) для tornado-диаграмм.
+    Допуск, дедлайн и отмена по `run_id` — как в /api/run.
+    """
+    import config as cfg
+    started = time.monotonic()
+    data = request.get_json() or {}
+    from sensitivity import PARAMS, STATE_NAMES, run_sensitivity, relative_sensitivities
+    names = data.get('params') or list(PARAMS)
+    unknown = [p for p in names if p not in PARAMS]
+    if unknown:
+        return jsonify({'error': f'unknown params: {unknown}', 'supported': list(PARAMS)}), 400
+
+    params = canonical_params(data)
+    error = invalid_params(params)
+    if error is None and params['model_mode'] != 'full':
+        # run_sensitivity интегрирует только полную модель с шагом dt
+        error = f"sensitivities are computed with the full model only, got model_mode={params['model_mode']!r}"
+    if error is not None:
+        g.error_type = 'invalid_params'
+        return jsonify({'error': error}), 400
+    deadline = started + cfg.web_run_timeout_s
+    # каждый параметр добавляет к траектории ещё одну систему того же размера
+    steps, seconds, error = _check_budget(params, 1 + len(names), deadline)
+    if error is not None:
+        return error
+
+    def run(cancel):
+        with _tracked('sensitivity', params) as info, _config_locked(deadline):
+            snap = snapshot_cfg(PARAM_KEYS)
+            try:
+                for k, v in params.items():
+                    setattr(cfg, k, v)
+                times, results, sens = run_sensitivity(names, cancel=cancel, deadline=deadline, info=info)
+                # значения параметров нужны для нормировки, пока config переопределён
+                tornado = relative_sensitivities(results, sens)
+                values = {p: getattr(cfg, p) for p in names}
+            finally:
+                restore_cfg(snap)
+        return {
+            'times': times,
+            'params': values,
+            'sensitivities': {
+                p: {name: [s[i] for s in sens[p]] for i, name in enumerate(STATE_NAMES)}
+                for p in names
+            },
+            'tornado': tornado,
+            'model_mode': 'full',
+            'aborted': info['aborted'],
+        }
+
+    key = json.dumps(['sensitivity', params, names], sort_keys=True)
+    try:
+        payload, _ = _analysis_flight.do(key, _admitted(seconds, run), run_id=data.get('run_id'))
+    except Overloaded:
+        return _busy_response(seconds)
+    return jsonify(payload)
+
+
+@app.route('/api/montecarlo', methods=['POST'])
+def run_monte_carlo_api():
+    """
+    Монте-Карло по допускам параметров: доверительные полосы p_emk, T_b, G.
+    JSON: переопределения параметров (как в /api/run), `samples` и
+    необязательные `distributions` ({name: ['normal'|'uniform', ширина]}).
+    Допуск, дедлайн и отмена по `run_id` — как в /api/run.
+    """
+    import config as cfg
+    from montecarlo import run_monte_carlo, parallelism
+    started = time.monotonic()
+    data = request.get_json() or {}
+
+    # полный набор параметров: процессы-работники не зависят от текущего config
+    overrides = canonical_params(data)
+    samples = data.get('samples', cfg.mc_samples)
+    if isinstance(samples, float) and samples.is_integer():
+        samples = int(samples)
+    if not isinstance(samples, int) or isinstance(samples, bool):
+        g.error_type = 'invalid_params'
+        return jsonify({'error': f'samples must be an integer, got {samples!r}'}), 400
+    samples = max(1, min(samples, cfg.mc_max_samples_web))
+    distributions = data.get('distributions')
+    if distributions is not None:
+        error = invalid_distributions(distributions)
+        if error is not None:
+            g.error_type = 'invalid_params'
+            return jsonify({'error': error}), 400
+
+    deadline = started + cfg.web_run_timeout_s
+    # реализации считаются параллельно в `parallelism` процессах
+    workers = parallelism(samples)
+    steps, seconds, error = _check_budget(overrides, samples / workers, deadline)
+    if error is not None:
+        return error
+
+    def run(cancel):
+        with _tracked('montecarlo', overrides) as info:
+            if workers > 1:
+                # реализации считаются в процессах-работниках со своим config
+                bands = run_monte_carlo(samples=samples, distributions=distributions, overrides=overrides,
+                                        workers=workers, cancel=cancel, deadline=deadline)
+            else:
+                # при одном процессе реализации считаются здесь же и переопределяют config
+                with _config_locked(deadline):
+                    bands = run_monte_carlo(samples=samples, distributions=distributions,
+                                            overrides=overrides, workers=workers,
+                                            cancel=cancel, deadline=deadline)
+            info['aborted'] = bands['aborted']
+        return bands
+
+    key = json.dumps(['montecarlo', overrides, samples, distributions], sort_keys=True)
+    try:
+        bands, _ = _analysis_flight.do(key, _admitted(seconds, run), run_id=data.get('run_id'))
+    except Overloaded:
+        return _busy_response(seconds)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(bands)
+
+
 if __name__ == '__main__':
     app.run(debug=True, port=5000)
@@ -9,16 +9,87 @@ function setStatus(msg, err=false){
   s.style.color = err ? 'crimson' : 'black';
 }
 
+// Client-side limit for a single /api/run request, ms (server has its own deadline)
+const RUN_TIMEOUT_MS = 120000;
+let currentRun = null;  // {id, controller} of the request in progress
+
+function newRunId(){
+  if(window.crypto && crypto.randomUUID) return crypto.randomUUID();
+  return Date.now().toString(36) + Math.random().toString(36).slice(2);
+}
+
+// Tell the server we no longer need the result so it can stop the computation
+function cancelRun(run){
+  if(!run) return;
+  navigator.sendBeacon('/api/cancel', run.id);
+  run.controller.abort();
+}
+
+// POST a cancellable computation (run_id, Stop button, client timeout).
+// Returns the parsed JSON body, or null after reporting the error in the status line.
+async function startRun(url, params){
+  const run = {id: newRunId(), controller: new AbortController()};
+  currentRun = run;
+  const timer = setTimeout(()=>cancelRun(run), RUN_TIMEOUT_MS);
+  let r;
+  try{
+    r = await fetch(url, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify(Object.assign({run_id: run.id}, params)),
+      signal: run.controller.signal
+    });
+  }catch(e){
+    setStatus('Расчёт отменён', true);
+    return null;
+  }finally{
+    clearTimeout(timer);
+    if(currentRun === run) currentRun = null;
+  }
+  if(r.status === 422){
+    const err = await r.json();
+    setStatus('Слишком долгий расчёт: ~' + Math.round(err.estimated_seconds) + ' с (лимит ' + err.budget_seconds + ' с). Увеличьте dt или уменьшите t_max', true);
+    return null;
+  }
+  if(r.status === 400){
+    const err = await r.json();
+    setStatus('Неверные параметры: ' + err.error, true);
+    return null;
+  }
+  if(r.status === 503){ setStatus('Сервер занят, повторите позже', true); return null }
+  if(!r.ok){ setStatus('Ошибка сервера', true); return null }
+  return r.json();
+}
+
+function abortReason(data){
+  return data.aborted === 'deadline' ? 'превышено время' : 'отменён';
+}
+
 async function runSim(params){
   setStatus('Запуск симуляции...');
-  const r = await fetch('/api/run', {
-    method: 'POST',
-    headers: { 'Content-Type': 'application/json' },
-    body: JSON.stringify(params)
-  });
-  if(!r.ok){ setStatus('Ошибка сервера', true); return null }
-  const data = await r.json();
-  setStatus('Готово — визуализация обновлена');
+  const data = await startRun('/api/run', params);
+  if(!data) return null;
+  if(data.aborted){
+    setStatus('Расчёт прерван (' + abortReason(data) + ') на t = ' + data.times[data.times.length-1].toFixed(3) + ' с — показан частичный результат', true);
+  } else if(data.model_switches && data.model_switches.length){
+    const sw = data.model_switches.map(([ts, m])=>ts.toFixed(3) + ' с → ' + (m === 'reduced' ? 'G = G_cmd' : 'полная')).join(', ');
+    setStatus('Готово — переключения модели: ' + sw);
+  } else {
+    setStatus('Готово — визуализация обновлена');
+  }
+  return data;
+}
+
+async function runMonteCarlo(params, samples){
+  setStatus('Монте-Карло: ' + samples + ' реализаций...');
+  const data = await startRun('/api/montecarlo', Object.assign({}, params, {samples: samples}));
+  if(!data) return null;
+  if(data.aborted){
+    if(!data.samples){ setStatus('Монте-Карло прерван (' + abortReason(data) + ') до первой реализации', true); return null }
+    setStatus('Монте-Карло прерван (' + abortReason(data) + ') — полосы по ' + data.samples + ' реализациям', true);
+  } else {
+    setStatus('Готово — полосы по ' + data.samples + ' реализациям');
+  }
   return data;
 }
 
@@ -91,6 +162,37 @@ function plotAll(data){
   renderPlot('plot_G', p4, {title:'Массовый расход', xaxis:{title:'t, s'}, yaxis:{title:'kg/s'}});
 }
 
+// Confidence bands from /api/montecarlo: shaded q05..q95 band, median and mean
+function plotBands(data){
+  const t = data.times;
+  const qs = data.quantiles;
+  const lo = qs[0], hi = qs[qs.length-1];
+
+  function bandTraces(name, band, color){
+    const traces = [
+      {x:t, y:band[hi], name:name+' '+hi, line:{width:0, color:color}, showlegend:false, hoverinfo:'skip'},
+      {x:t, y:band[lo], name:name+' '+lo+'…'+hi, fill:'tonexty', line:{width:0, color:color}, fillcolor:color.replace('rgb','rgba').replace(')',',0.2)')},
+      {x:t, y:band.mean, name:name+' (среднее)', line:{color:color}}
+    ];
+    if(band.q50) traces.push({x:t, y:band.q50, name:name+' (медиана)', line:{color:color, dash:'dot'}});
+    return traces;
+  }
+
+  function renderPlot(id, traces, layout){
+    const gd = document.getElementById(id);
+    if(!gd) return;
+    try{ Plotly.purge(gd); }catch(e){}
+    gd.style.width = '';
+    gd.style.height = '';
+    Plotly.newPlot(gd, traces, Object.assign({autosize:true, margin:{t:40}}, layout), {responsive:true});
+  }
+
+  const o = data.outputs;
+  renderPlot('plot_pressures', bandTraces('p_emk', o.p_emk, 'rgb(255,127,14)'), {title:'Давление в ёмкости (Монте-Карло)', xaxis:{title:'t, s'}, yaxis:{title:'Па'}});
+  renderPlot('plot_temps', bandTraces('T_b', o.T_b, 'rgb(31,119,180)'), {title:'Температура в баллоне (Монте-Карло)', xaxis:{title:'t, s'}, yaxis:{title:'K'}});
+  renderPlot('plot_G', bandTraces('G', o.G, 'rgb(214,39,40)'), {title:'Массовый расход (Монте-Карло)', xaxis:{title:'t, s'}, yaxis:{title:'kg/s'}});
+}
+
 document.addEventListener('DOMContentLoaded', async ()=>{
   const defaults = await getDefaultParams();
   const form = document.getElementById('paramsForm');
@@ -118,6 +220,22 @@ document.addEventListener('DOMContentLoaded', async ()=>{
     if(data) plotAll(data);
   });
 
+  document.getElementById('stopBtn').addEventListener('click', ()=>{
+    if(currentRun) cancelRun(currentRun);
+  });
+  window.addEventListener('pagehide', ()=>{ if(currentRun) cancelRun(currentRun); });
+
+  document.getElementById('mcBtn').addEventListener('click', async ()=>{
+    const params = {};
+    for(const [k,v] of new FormData(form).entries()){
+      const el = form.elements[k];
+      params[k] = (el && el.tagName === 'SELECT') ? v : Number(v);
+    }
+    const samples = Number(document.getElementById('mcSamples').value) || 200;
+    const data = await runMonteCarlo(params, samples);
+    if(data) plotBands(data);
+  });
+
   document.getElementById('resetBtn').addEventListener('click', ()=>{
     for(const el of form.elements){ if(el.name && defaults[el.name] !== undefined){ el.value = defaults[el.name]; } }
     setStatus('Параметры сброшены');
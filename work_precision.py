@@ -0,0 +1,363 @@
+"""
+Исследование «работа — точность» (work-precision) для выбора шага dt.
+
+Для каждой модели газа (`gas_model`: 'ideal', 'vdw') строится эталонное
+решение с очень мелким шагом. Его собственная погрешность оценивается по
+Ричардсону на трёх уровнях h, h/2, h/4 с наблюдаемым порядком сходимости
+p = log2(|y(h) - y(h/2)| / |y(h/2) - y(h/4)|). Правая часть негладкая:
+командный расход G_cmd скачком меняется при смене режима истечения
+(p_emk = beta * p_b), и RK4, шагающий через этот момент, теряет порядок.
+Поэтому эталон разрешает событие: шаг, на котором меняется знак
+p_emk - beta * p_b, укорачивается бисекцией так, чтобы граница шага
+пришлась на смену режима, а моменты сравнения попадают точно на границы
+шагов. Тогда наблюдаемый порядок близок к 4; если нет (и разности уровней
+выше ошибок округления) — выводится предупреждение. Затем перебираются шаги dt и доступные
+варианты интегрирования (`model_mode` из `simulation.py`: полная модель,
+автоматическое переключение, квазистационарная модель). Для каждого
+варианта фиксируются:
+
+    - относительные погрешности p_b, p_emk, T_b, T_emk в моменты `--times`
+      (максимум по моментам) относительно эталона; по умолчанию моменты
+      покрывают и переходный процесс выпуска, и установившиеся значения;
+    - время расчёта (лучшее из `--repeat` запусков);
+    - число вычислений правой части (rhs / rhs_reduced).
+
+Результаты печатаются таблицами, сохраняются в CSV и на графики
+«погрешность — время» и «погрешность — число вычислений правой части».
+При заданном `--target` для каждой модели газа выводится самый дешёвый
+вариант, укладывающийся в требуемую точность.
+
+Запуск:
+    python work_precision.py
+    python work_precision.py --gas-models ideal --dt 1e-3 5e-4 2.5e-4 --target 1e-4
+"""
+
+import argparse
+import csv
+import math
+import time
+
+import config as cfg
+import equations
+import simulation
+
+VARIABLES = (('p_b', 0), ('p_emk', 2), ('T_b', 1), ('T_emk', 3))
+DEFAULT_DTS = (4e-3, 2e-3, 1e-3, 5e-4, 2.5e-4, 1.25e-4)
+# моменты сравнения до конца t_max: переходный процесс выпуска и плато
+DEFAULT_TIMES = (0.05, 0.1, 0.2, 0.5, 1.0)
+# допустимое отклонение наблюдаемого порядка эталона от 4 (RK4)
+ORDER_TOLERANCE = 1.0
+# точность положения смены режима в эталоне, доля шага
+EVENT_TOLERANCE = 1e-12
+# ниже этой отн. погрешности разности уровней эталона — ошибки округления,
+# наблюдаемый порядок не проверяется
+ROUNDOFF_FLOOR = 1e-12
+
+
+class _RhsCounter:
+    """Подсчёт вычислений правой части на время одного расчёта."""
+
+    def __init__(self):
+        self.count = 0
+        self._saved = []
+
+    def __enter__(self):
+        self.count = 0
+        for module in (equations, simulation):
+            for name in ('rhs', 'rhs_reduced'):
+                original = getattr(module, name)
+                self._saved.append((module, name, original))
+                setattr(module, name, self._wrap(original))
+        return self
+
+    def _wrap(self, fn):
+        def counted(t, y):
+            self.count += 1
+            return fn(t, y)
+        return counted
+
+    def __exit__(self, *exc):
+        for module, name, original in reversed(self._saved):
+            setattr(module, name, original)
+        self._saved = []
+        return False
+
+
+def run_case(times, gas_model, dt, mode, repeat=1):
+    """
+    Один вариант: состояния в моменты `times`, лучшее время и число вычислений rhs.
+    """
+    snap = {k: getattr(cfg, k) for k in ('gas_model', 'dt', 't_max')}
+    try:
+        cfg.gas_model = gas_model
+        cfg.dt = dt
+        cfg.t_max = max(times)
+        with _RhsCounter() as counter:
+            _, results = simulation.run_simulation(output_times=times, mode=mode)
+        evals = counter.count
+        # время меряем без счётчика
+        best = float('inf')
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            simulation.run_simulation(output_times=times, mode=mode)
+            best = min(best, time.perf_counter() - t0)
+    finally:
+        for k, v in snap.items():
+            setattr(cfg, k, v)
+    return results, best, evals
+
+
+def rel_errors(results, reference):
+    """Максимальная по моментам относительная погрешность каждой переменной."""
+    out = {}
+    for name, i in VARIABLES:
+        out[name] = max(abs(r[i] - ref[i]) / abs(ref[i]) for r, ref in zip(results, reference))
+    return out
+
+
+def _regime_gap(y):
+    """p_emk - beta * p_b: знак определяет режим истечения (< 0 — критический)."""
+    n = cfg.n
+    beta = (2 / (n + 1)) ** (n / (n - 1))
+    return y[2] - beta * y[0]
+
+
+class _FrozenRegime:
+    """
+    Командный расход в заданном режиме истечения на время расчёта эталона:
+    `equations.mass_flow` не переключается по p_emk / beta * p_b, а продолжает
+    формулу текущего режима (`critical`) за границу.
+    """
+
+    def __init__(self, critical):
+        self.critical = critical
+        self._saved = None
+
+    def __enter__(self):
+        self._saved = equations.mass_flow
+        equations.mass_flow = self._mass_flow
+        return self
+
+    def _mass_flow(self, p_b, T_b, p_emk):
+        if p_emk >= p_b or T_b <= 0:
+            return 0.0
+        if self.critical:
+            return cfg.mu_f * cfg.m * p_b / math.sqrt(T_b)
+        n = cfg.n
+        return cfg.mu_f * equations.phi(p_emk / p_b) * math.sqrt(2 * n / (cfg.R * (n - 1)) * (p_b / T_b))
+
+    def __exit__(self, *exc):
+        equations.mass_flow = self._saved
+        return False
+
+
+def _resolved_run(times, gas_model, dt):
+    """
+    Полная модель с постоянным шагом dt и разрешением смены режима истечения.
+
+    Внутри шага режим заморожен (`_FrozenRegime`), поэтому все стадии RK4
+    видят гладкую правую часть. Шаг, после которого меняется знак
+    `_regime_gap`, заменяется более коротким: его длина находится бисекцией
+    с точностью EVENT_TOLERANCE * dt, после чего режим переключается и
+    производная пересчитывается. Шаги укорачиваются и перед моментами
+    `times`, поэтому состояния в них получаются без интерполяции.
+    Возвращает состояния в моменты `times`.
+    """
+    snap = {k: getattr(cfg, k) for k in ('gas_model',)}
+    try:
+        cfg.gas_model = gas_model
+        t = 0.0
+        y = simulation.initial_state()
+        results = []
+        with _FrozenRegime(_regime_gap(y) <= 0) as regime:
+            f = simulation.derivative(t, y)
+            for t_out in sorted(times):
+                while t < t_out:
+                    h = min(dt, t_out - t)
+                    y_next, f_next = simulation.advance(t, y, f, h)
+                    if (_regime_gap(y_next) <= 0) != regime.critical:
+                        lo = 0.0
+                        while h - lo > EVENT_TOLERANCE * dt:
+                            mid = 0.5 * (lo + h)
+                            y_mid, f_mid = simulation.advance(t, y, f, mid)
+                            if (_regime_gap(y_mid) <= 0) == regime.critical:
+                                lo = mid
+                            else:
+                                h, y_next = mid, y_mid
+                        regime.critical = not regime.critical
+                        f_next = simulation.derivative(t + h, y_next)
+                    t = t_out if h >= t_out - t else t + h
+                    y, f = y_next, f_next
+                results.append(list(y))
+    finally:
+        for k, v in snap.items():
+            setattr(cfg, k, v)
+    return results
+
+
+def reference_solution(times, gas_model, dt_ref):
+    """
+    Эталон с шагом dt_ref / 4 (полная модель, смена режима истечения
+    разрешена, см. `_resolved_run`) и оценка его погрешности по Ричардсону
+    с наблюдаемым порядком. Решения с шагами dt_ref, dt_ref / 2 и
+    dt_ref / 4 дают e1 = |y(h) - y(h/2)|, e2 = |y(h/2) - y(h/4)|; порядок
+    p = log2(e1 / e2), погрешность y(h/4) ≈ e2 / (2^p - 1).
+
+    Возвращает (reference, est, orders): для переменной без сходимости
+    (p <= 0) оценкой погрешности служит e2, а порядок равен nan.
+    """
+    coarse = _resolved_run(times, gas_model, dt_ref)
+    half = _resolved_run(times, gas_model, dt_ref / 2)
+    quarter = _resolved_run(times, gas_model, dt_ref / 4)
+    e1 = rel_errors(coarse, half)
+    e2 = rel_errors(half, quarter)
+    est = {}
+    orders = {}
+    for name, _ in VARIABLES:
+        if e2[name] == 0:
+            est[name] = 0.0
+            orders[name] = math.inf if e1[name] > 0 else math.nan
+        elif e1[name] > e2[name]:
+            p = math.log2(e1[name] / e2[name])
+            orders[name] = p
+            est[name] = e2[name] / (2 ** p - 1)
+        else:
+            orders[name] = math.nan
+            est[name] = e2[name]
+    return quarter, est, orders
+
+
+def study(gas_models, dts, modes, times, dt_ref, repeat=1):
+    rows = []
+    references = {}
+    for gas_model in gas_models:
+        print(f"\nЭталон для gas_model='{gas_model}': dt = {dt_ref:g}, {dt_ref / 2:g}, {dt_ref / 4:g} ...")
+        reference, ref_err, orders = reference_solution(times, gas_model, dt_ref)
+        references[gas_model] = ref_err
+        print("  наблюдаемый порядок: " +
+              ", ".join(f"{name} {p:.2f}" for name, p in orders.items()))
+        print("  оценка погрешности эталона: " +
+              ", ".join(f"{name} {err:.1e}" for name, err in ref_err.items()))
+        off = [name for name, p in orders.items()
+               if not (abs(p - 4) <= ORDER_TOLERANCE or ref_err[name] <= ROUNDOFF_FLOOR)]
+        if off:
+            print(f"  ВНИМАНИЕ: порядок сходимости {', '.join(off)} далёк от 4 — "
+                  "оценка погрешности эталона ненадёжна; измените --ref-dt")
+        for mode in modes:
+            for dt in dts:
+                results, wall, evals = run_case(times, gas_model, dt, mode, repeat)
+                errors = rel_errors(results, reference)
+                row = {'gas_model': gas_model, 'mode': mode, 'dt': dt,
+                       'wall_s': wall, 'rhs_evals': evals}
+                row.update(errors)
+                row['max_err'] = max(errors.values())
+                rows.append(row)
+    return rows, references
+
+
+def print_tables(rows, times):
+    header = f"{'dt':>10} {'время, с':>10} {'rhs':>9} " + " ".join(f"{name:>10}" for name, _ in VARIABLES)
+    groups = {}
+    for row in rows:
+        groups.setdefault((row['gas_model'], row['mode']), []).append(row)
+    for (gas_model, mode), group in groups.items():
+        print(f"\n=== gas_model = {gas_model}, model_mode = {mode} "
+              f"(отн. погрешность, макс. по t = {', '.join(f'{t:g}' for t in times)} с) ===")
+        print(header)
+        for row in group:
+            print(f"{row['dt']:>10.3g} {row['wall_s']:>10.4f} {row['rhs_evals']:>9d} " +
+                  " ".join(f"{row[name]:>10.2e}" for name, _ in VARIABLES))
+
+
+def cheapest(rows, target, references=None):
+    """
+    Самый дешёвый (по времени) вариант с max_err <= target для каждой модели газа.
+    references — оценки погрешности эталонов: они прибавляются к измеренной погрешности.
+    """
+    best = {}
+    for row in rows:
+        ref_err = max((references or {}).get(row['gas_model'], {}).values(), default=0.0)
+        if row['max_err'] + ref_err <= target:
+            cur = best.get(row['gas_model'])
+            if cur is None or row['wall_s'] < cur['wall_s']:
+                best[row['gas_model']] = row
+    return best
+
+
+def save_csv(rows, path):
+    fields = ['gas_model', 'mode', 'dt', 'wall_s', 'rhs_evals'] + [name for name, _ in VARIABLES] + ['max_err']
+    with open(path, 'w', newline='') as fh:
+        writer = csv.DictWriter(fh, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f"\nТаблица сохранена в: {path}")
+
+
+def plot(rows, path):
+    import matplotlib.pyplot as plt
+
+    gas_models = sorted({row['gas_model'] for row in rows})
+    fig, axes = plt.subplots(len(gas_models), 2, figsize=(13, 4.5 * len(gas_models)), squeeze=False)
+    for g_i, gas_model in enumerate(gas_models):
+        modes = sorted({row['mode'] for row in rows if row['gas_model'] == gas_model})
+        for col, (key, xlabel) in enumerate((('wall_s', 'Время расчёта (с)'),
+                                             ('rhs_evals', 'Вычислений правой части'))):
+            ax = axes[g_i][col]
+            for mode in modes:
+                group = [row for row in rows if row['gas_model'] == gas_model and row['mode'] == mode]
+                for name, _ in VARIABLES:
+                    ax.loglog([row[key] for row in group], [max(row[name], 1e-16) for row in group],
+                              marker='o', label=f"{name} ({mode})")
+            ax.set_xlabel(xlabel)
+            ax.set_ylabel("Отн. погрешность")
+            ax.set_title(f"Работа — точность, gas_model = {gas_model}")
+            ax.grid(True, which='both', alpha=0.3)
+            ax.legend(fontsize=8)
+    plt.tight_layout()
+    plt.savefig(path, dpi=150, bbox_inches='tight')
+    print(f"График сохранён в: {path}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Work-precision: погрешность против стоимости для шагов dt")
+    parser.add_argument('--dt', type=float, nargs='+', default=list(DEFAULT_DTS), help="перебираемые шаги, с")
+    parser.add_argument('--gas-models', nargs='+', default=['ideal', 'vdw'], choices=['ideal', 'vdw'])
+    parser.add_argument('--modes', nargs='+', default=list(simulation.MODEL_MODES),
+                        choices=list(simulation.MODEL_MODES), help="варианты модели/интегрирования")
+    parser.add_argument('--times', type=float, nargs='+',
+                        default=[t for t in DEFAULT_TIMES if t < cfg.t_max] + [cfg.t_max],
+                        help="моменты сравнения, с (последний задаёт длительность расчёта)")
+    parser.add_argument('--ref-dt', type=float, default=None,
+                        help="крупнейший из трёх шагов эталона h, h/2, h/4 (по умолчанию max(dt) / 4)")
+    parser.add_argument('--repeat', type=int, default=1, help="повторов для замера времени")
+    parser.add_argument('--target', type=float, default=None, help="требуемая отн. точность")
+    parser.add_argument('--out', default='work_precision', help="префикс файлов .csv и .png")
+    parser.add_argument('--no-plot', action='store_true')
+    args = parser.parse_args(argv)
+
+    times = sorted(set(args.times))
+    dts = sorted(set(args.dt), reverse=True)
+    # эталон сходится с 4-м порядком: более мелкий шаг упирается в ошибки округления
+    dt_ref = args.ref_dt or max(dts) / 4
+
+    rows, references = study(args.gas_models, dts, args.modes, times, dt_ref, args.repeat)
+    print_tables(rows, times)
+    save_csv(rows, args.out + '.csv')
+
+    if args.target is not None:
+        print(f"\nСамые дешёвые варианты с погрешностью <= {args.target:g} (с учётом погрешности эталона):")
+        best = cheapest(rows, args.target, references)
+        for gas_model in args.gas_models:
+            row = best.get(gas_model)
+            if row is None:
+                print(f"  {gas_model}: ни один вариант не достигает точности — уменьшите dt")
+            else:
+                print(f"  {gas_model}: model_mode = {row['mode']}, dt = {row['dt']:g} "
+                      f"({row['wall_s']:.3f} с, {row['rhs_evals']} выч. rhs, погрешность {row['max_err']:.1e})")
+
+    if not args.no_plot:
+        plot(rows, args.out + '.png')
+
+
+if __name__ == "__main__":
+    main()